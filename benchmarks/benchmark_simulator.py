@@ -0,0 +1,222 @@
+"""Throughput benchmark of the simulator over generated network families.
+
+Networks of all five graph_maker types are generated at several sizes and
+edge densities with fixed seeds, saved with network_to_excel (with random
+initial values), and simulated with simulate_network. For each network
+the benchmark measures the model load time, the simulation steps and runs
+per second (best of --repeat timings), and the peak memory of the simulation (traced in a second,
+untimed pass), and writes the results to a JSON file. Runs of the benchmark
+on different commits can be compared with --compare.
+
+Example:
+    python benchmarks/benchmark_simulator.py --output results.json
+    python benchmarks/benchmark_simulator.py --output new.json --compare results.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import datetime as dt
+
+import numpy as np
+import networkx as nx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'dependencies'))
+
+import Simulator.simulator as sim
+from Simulator.modelfile import model_cache
+from Simulator.exact import TooManyStates
+from FIDDLE import graph_maker, network_to_excel, create_initial_values_random, simulate_network
+
+#Column of the initial values in the network files
+INITIAL_COLUMN = 6
+
+
+def network_configurations(sizes, degrees):
+    """Returns the list of (network_type, nodes, degree, graph_maker keyword arguments) to benchmark.
+    The growing networks (types 1-3) have a fixed density, the Erdős-Rényi (4) and Barabási–Albert (5) networks
+    are generated with each mean degree (in- plus out-degree) in degrees.
+    """
+    configurations = []
+    for nodes in sizes:
+        configurations.append((1, nodes, None, {}))
+        configurations.append((2, nodes, None, {'edge_probability': 0.5}))
+        configurations.append((3, nodes, None, {}))
+        for degree in degrees:
+            #Each directed edge adds 2 to the sum of degrees
+            configurations.append((4, nodes, degree, {'edge_probability': min(degree/(2*(nodes-1)), 1)}))
+            configurations.append((5, nodes, degree, {'attaching_edges': max(1, min(round(degree/2), nodes-1))}))
+    return configurations
+
+
+def make_network_file(network_type, nodes, kwargs, seed, filename):
+    """Generates a network with graph_maker, with random initial values, and saves it to filename.
+    Returns the number of nodes and edges of the network.
+    """
+    G = graph_maker(network_type, nodes, 0.5, seed=seed, **kwargs)
+    #The network files need string node names
+    G = nx.relabel_nodes(G, str)
+    network_to_excel(G, filename, initial_values=create_initial_values_random(G, seed=seed))
+    return G.number_of_nodes(), G.number_of_edges()
+
+
+def exact_accepts(filename, steps):
+    """Returns True if the exact engine accepts the network, rather than falling back to sampling runs.
+    The engine rejects a network from a bound of its number of states, before exploring any state.
+    """
+    try:
+        sim.Manager(filename, INITIAL_COLUMN).simulate(1, steps, engine='exact', fallback=None)
+    except TooManyStates:
+        return False
+    return True
+
+
+def best_time(function, repeat):
+    """Returns the shortest time of repeat calls of function, the least disturbed by other processes."""
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark_network(filename, runs, steps, engine, seed, memory, repeat):
+    """Returns the measurements of the simulation of a network file.
+    The throughput is that of simulate_network as a whole, including loading the model and writing the trace.
+    """
+    #Model load time, parsing the file rather than reading the cache of parsed model files
+    def load():
+        model_cache.clear()
+        sim.Manager(filename, INITIAL_COLUMN)
+    load_time = best_time(load, repeat)
+
+    #Simulation throughput, the simulator drawing from the random module
+    output_file = filename + '.trace.txt'
+    def simulate():
+        random.seed(seed)
+        simulate_network(filename, runs, steps, output_file, engine=engine)
+    simulation_time = best_time(simulate, repeat)
+
+    results = {
+        'load_time_s': load_time,
+        'simulate_time_s': simulation_time,
+        'steps_per_s': runs*steps/simulation_time,
+        'runs_per_s': runs/simulation_time,
+        'peak_memory_bytes': None,
+    }
+
+    #Peak memory of the same simulation, traced separately as tracing slows it down
+    if memory:
+        random.seed(seed)
+        tracemalloc.start()
+        simulate_network(filename, runs, steps, output_file, engine=engine)
+        results['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    os.remove(output_file)
+    return results
+
+
+def environment():
+    """Returns a description of the machine and code being benchmarked."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'date': dt.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'networkx': nx.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def case_key(case):
+    """Returns the key identifying a benchmark case across result files."""
+    return (case['network_type'], case['nodes'], case['degree'], case['engine'], case['runs'], case['steps'])
+
+
+def compare_results(old_file, results):
+    """Prints the ratio of the steps per second (and peak memory) of the results to those of an older result file."""
+    with open(old_file) as f:
+        old = {case_key(case): case for case in json.load(f)['results']}
+    print("{:>5} {:>6} {:>6} {:>11} {:>12} {:>12}".format("type", "nodes", "degree", "engine", "speedup", "memory"))
+    for case in results:
+        before = old.get(case_key(case))
+        if before is None or 'skipped' in case or 'skipped' in before: continue
+        speedup = case['steps_per_s']/before['steps_per_s']
+        memory = case['peak_memory_bytes']/before['peak_memory_bytes'] \
+            if case['peak_memory_bytes'] and before['peak_memory_bytes'] else float('nan')
+        print("{:>5} {:>6} {:>6} {:>11} {:>11.2f}x {:>11.2f}x".format(case['network_type'], case['nodes'], str(case['degree']), case['engine'], speedup, memory))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulator over networks generated by graph_maker.")
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON file in which to save the results")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 200, 1000], help="numbers of nodes")
+    parser.add_argument('--degrees', type=float, nargs='+', default=[2, 6], help="mean degrees of the type 4 and 5 networks")
+    parser.add_argument('--engines', nargs='+', default=['scalar', 'vectorized'], help="simulation engines to benchmark")
+    parser.add_argument('--runs', type=int, default=20, help="simulation runs")
+    parser.add_argument('--steps', type=int, default=500, help="simulation steps")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the networks, initial values and simulations")
+    parser.add_argument('--repeat', type=int, default=3, help="number of timings of each measurement, the shortest being kept")
+    parser.add_argument('--no-memory', action='store_true', help="skip the peak memory pass")
+    parser.add_argument('--compare', help="result file of an earlier run to compare with")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for network_type, nodes, degree, kwargs in network_configurations(args.sizes, args.degrees):
+            filename = os.path.join(directory, 'network_{}_{}_{}.xlsx'.format(network_type, nodes, degree))
+            actual_nodes, edges = make_network_file(network_type, nodes, kwargs, args.seed, filename)
+            for engine in args.engines:
+                case = {
+                    'network_type': network_type,
+                    'nodes': nodes,
+                    'degree': degree,
+                    'actual_nodes': actual_nodes,
+                    'edges': edges,
+                    'engine': engine,
+                    'runs': args.runs,
+                    'steps': args.steps,
+                }
+                #Skipped cases are recorded with the reason, without measurements
+                if engine == 'exact' and not exact_accepts(filename, args.steps):
+                    case['skipped'] = "too many states for the exact engine"
+                else:
+                    try:
+                        case.update(benchmark_network(filename, args.runs, args.steps, engine, args.seed, not args.no_memory, args.repeat))
+                    except ValueError as e:
+                        #e.g. an engine that does not support this network
+                        case['skipped'] = str(e)
+                if 'skipped' in case:
+                    results.append(case)
+                    print("type {} nodes {} degree {} {}: skipped, {}".format(network_type, nodes, degree, engine, case['skipped']))
+                    continue
+                results.append(case)
+                print("type {} nodes {} degree {} {}: load {:.3f}s, {:.0f} steps/s, {:.2f} runs/s".format(
+                    network_type, nodes, degree, engine, case['load_time_s'], case['steps_per_s'], case['runs_per_s']))
+
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(), 'settings': vars(args), 'results': results}, f, indent=1)
+
+    if args.compare:
+        compare_results(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
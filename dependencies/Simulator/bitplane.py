@@ -0,0 +1,321 @@
+import random
+import numpy as np
+from .vectorized import leaf_table, VAR, NOT, HIGHEST, NOT_HIGHEST, PAD
+
+# number of runs packed into one word of a bitplane
+WORD = 64
+ONES = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+class BitplaneEngine(object):
+	""" Define a simulation engine for models whose elements have 2 or 3 states,
+		packing the values of 64 runs into each word of two bitplanes:
+		the first holds the runs where an element is at least 1, the second
+		the runs where it is 2 (a thermometer code). With this code, the
+		max (OR) and min (AND) of values are the bitwise OR and AND of the
+		planes, so the rules of all runs are evaluated a word at a time.
+		The delay counters are bit-sliced the same way. As in the other
+		engines, the delay counters of every run start at 0.
+	"""
+
+	def __init__(self, state, update_list):
+		""" Initialize the engine from a model
+			Inputs:
+				state : ModelState of the model (values, max states, delays)
+				update_list : list of gateNode objects of the elements with regulators
+		"""
+
+		n = len(state.names)
+		if any(x not in (2, 3) for x in state.max_state):
+			raise ValueError('The bitplane engine only supports elements with 2 or 3 states')
+		self.__n = n
+		self.__initial = np.array(state.initial, dtype=np.int64)
+		self.__values = np.array(state.values, dtype=np.int64)
+		self.__top = np.array(state.max_state, dtype=np.int64) - 1
+		# the highest state of each element is 2, as a word mask
+		self.__three = np.where(self.__top==2, ONES, np.uint64(0))
+		self.__delay_act = np.array(state.delay_act, dtype=np.int64)
+		self.__delay_inh = np.array(state.delay_inh, dtype=np.int64)
+		# number of bit slices of the delay counters, which never exceed the delays
+		self.__slices = max(int(max(list(state.delay_act) + list(state.delay_inh) + [1])).bit_length(), 1)
+		self.__update = np.array([ele.get_index() for ele in update_list], dtype=np.int64)
+
+		# Rules are stored as leaf tables, as in the vectorized engine,
+		# and rules with necessary pairs as parsed terms
+		self.__has_act = np.zeros(n, dtype=bool)
+		self.__has_inh = np.zeros(n, dtype=bool)
+		self.__complex = dict()
+		act_tables = n * [[]]
+		inh_tables = n * [[]]
+		for ele in update_list:
+			i = ele.get_index()
+			act_terms, inh_terms = ele.parse_rules()
+			self.__has_act[i] = len(act_terms) > 0
+			self.__has_inh[i] = len(inh_terms) > 0
+			act_table = leaf_table(act_terms)
+			inh_table = leaf_table(inh_terms)
+			if act_table is None or inh_table is None:
+				self.__complex[i] = (act_terms, inh_terms)
+			else:
+				act_tables[i] = act_table
+				inh_tables[i] = inh_table
+		self.__is_complex = np.zeros(n, dtype=bool)
+		self.__is_complex[list(self.__complex)] = True
+		self.__act_pos, self.__act_kind = self.pad(act_tables)
+		self.__inh_pos, self.__inh_kind = self.pad(inh_tables)
+
+	def pad(self, tables):
+		""" returns the (elements x terms x leaves) arrays of positions and kinds of
+			the leaf tables, padded with the zero row
+		"""
+		terms = max([len(table) for table in tables] + [1])
+		leaves = max([len(term) for table in tables for term in table] + [1])
+		positions = np.full((len(tables), terms, leaves), self.__n, dtype=np.int64)
+		kinds = np.full((len(tables), terms, leaves), PAD, dtype=np.int8)
+		# a padding term scores 0
+		kinds[:, :, 0] = VAR
+		for i, table in enumerate(tables):
+			for t, term in enumerate(table):
+				for l, (pos, kind) in enumerate(term):
+					positions[i, t, l] = pos
+					kinds[i, t, l] = kind
+		return positions, kinds
+
+	def run(self, runs, simStep, trace=False, rng=None, steady_state=False, simtype='ra', steps=None):
+		""" Simulate all runs, see VectorizedEngine.run.
+			steady_state is accepted for compatibility but every step is simulated,
+			which gives the same distribution of values.
+		"""
+
+		if simtype not in ('ra', 'round', 'sync'):
+			raise ValueError('Unknown simulation scheme: '+str(simtype))
+		if simtype=='sync' and runs > 1:
+			# the scheme is deterministic, all runs are the same
+			freq_sum, memo, values = self.run(1, simStep, trace, rng, steady_state, simtype, steps)
+			return freq_sum * runs, (np.repeat(memo, runs, axis=1) if trace else None), \
+				np.repeat(values, runs, axis=0)
+		if rng is None:
+			rng = np.random.default_rng(random.getrandbits(64))
+
+		n = self.__n
+		update = self.__update
+		steps = np.arange(simStep+1) if steps is None else steps
+		# row of each step in freq_sum, -1 if the step is not recorded
+		recorded = np.full(simStep+1, -1)
+		recorded[steps] = np.arange(len(steps))
+		words = -(-runs // WORD)
+		# word and bit of each run
+		run_word = np.arange(runs) // WORD
+		run_bit = np.left_shift(np.uint64(1), (np.arange(runs) % WORD).astype(np.uint64))
+		# bits of the runs in each word
+		valid = np.zeros(words, dtype=np.uint64)
+		np.bitwise_or.at(valid, run_word, run_bit)
+
+		# planes of values (>= 1, >= 2) of every element, with an extra zero row
+		# used for padding, and the bit slices of the delay counters
+		X = np.zeros((2, n+1, words), dtype='<u8')
+		X[0, :n] = np.where(self.__initial[:, None] >= 1, valid, np.uint64(0))
+		X[1, :n] = np.where(self.__initial[:, None] >= 2, valid, np.uint64(0))
+		delay_act = np.zeros((self.__slices, n, words), dtype='<u8')
+		delay_inh = np.zeros((self.__slices, n, words), dtype='<u8')
+
+		freq_sum = np.zeros((len(steps), n), dtype=np.int64)
+		memo = None
+		if trace:
+			memo = np.zeros((len(steps), runs, n), dtype=np.uint8)
+		if steps[0]==0:
+			freq_sum[0] = self.__values * runs
+			if trace:
+				memo[0] = self.unpack(X, runs)
+
+		if simtype=='sync':
+			# every element in every word of the runs
+			all_elements = np.repeat(update, words)
+			all_words = np.tile(np.arange(words), len(update))
+			all_masks = np.tile(valid, len(update))
+
+		for step in range(1, simStep+1):
+			if simtype=='sync':
+				self.update(X, delay_act, delay_inh, all_elements, all_words, all_masks)
+			elif simtype=='round':
+				# each run updates every element once, in its own random order
+				order = rng.permuted(np.tile(np.arange(len(update)), (runs, 1)), axis=1)
+				for chosen in order.T:
+					self.update(X, delay_act, delay_inh, *self.group(chosen, run_word, run_bit, words))
+			elif len(update):
+				# each run picks one element to update
+				chosen = rng.integers(0, len(update), size=runs)
+				self.update(X, delay_act, delay_inh, *self.group(chosen, run_word, run_bit, words))
+			row = recorded[step]
+			if row >= 0:
+				freq_sum[row] = popcount(X[0, :n]) + popcount(X[1, :n])
+				if trace:
+					memo[row] = self.unpack(X, runs)
+
+		return freq_sum, memo, self.unpack(X, runs).astype(np.int64)
+
+	def group(self, chosen, run_word, run_bit, words):
+		""" returns the elements, words and bit masks of the runs updating
+			each element (chosen: position in the update list of each run)
+		"""
+		keys = chosen * words + run_word
+		# bits of distinct runs, so their sum is their OR,
+		# added in two halves to stay exact in floating point
+		low = np.bincount(keys, weights=(run_bit & np.uint64(0xFFFFFFFF)).astype(np.float64),
+			minlength=len(self.__update)*words)
+		high = np.bincount(keys, weights=(run_bit >> np.uint64(32)).astype(np.float64),
+			minlength=len(self.__update)*words)
+		masks = low.astype(np.uint64) | (high.astype(np.uint64) << np.uint64(32))
+		pairs = np.nonzero(masks)[0]
+		return self.__update[pairs // words], pairs % words, masks[pairs]
+
+	def unpack(self, X, runs):
+		""" returns the (runs x elements) values of the planes """
+		n = self.__n
+		bits = [np.unpackbits(X[k, :n].view(np.uint8), axis=1, bitorder='little')[:, :runs] for k in range(2)]
+		return (bits[0] + bits[1]).T
+
+	def update(self, X, delay_act, delay_inh, elements, words, masks):
+		""" Update the elements in the runs of the bit masks of the words,
+			all reading the values before the update
+		"""
+
+		three = self.__three[elements]
+		x1 = X[0, elements, words]
+		x2 = X[1, elements, words]
+		below_top = ~np.where(three==ONES, x2, x1)
+		above_0 = x1
+
+		# activation and inhibition scores
+		act_1, act_2 = self.score(X, elements, words, masks, three, self.__act_pos, self.__act_kind)
+		inh_1, inh_2 = self.score(X, elements, words, masks, three, self.__inh_pos, self.__inh_kind)
+		complex_pairs = np.nonzero(self.__is_complex[elements])[0]
+		if len(complex_pairs):
+			for i in np.unique(elements[complex_pairs]):
+				sub = complex_pairs[elements[complex_pairs]==i]
+				act_terms, inh_terms = self.__complex[i]
+				if act_terms:
+					act_1[sub], act_2[sub] = evaluate_terms(act_terms, X[:, :, words[sub]], masks[sub], self.__three[i])
+				if inh_terms:
+					inh_1[sub], inh_2[sub] = evaluate_terms(inh_terms, X[:, :, words[sub]], masks[sub], self.__three[i])
+
+		has_act = np.where(self.__has_act[elements], ONES, np.uint64(0))
+		has_inh = np.where(self.__has_inh[elements], ONES, np.uint64(0))
+		# activation > inhibition, in the thermometer code
+		greater = (act_1 & ~inh_1) | (act_2 & ~inh_2)
+		rise = (has_act & ~has_inh & act_1) | (has_act & has_inh & greater)
+		decay = has_act & ~rise
+		fall = ~has_act & has_inh & inh_1
+		grow = ~has_act & has_inh & ~fall
+
+		decaying = decay & above_0
+		hold_inh = decaying & less(delay_inh[:, elements, words], self.__delay_inh[elements])
+		done_inh = decaying & ~hold_inh
+		growing = grow & below_top
+		hold_act = growing & less(delay_act[:, elements, words], self.__delay_act[elements])
+		done_act = growing & ~hold_act
+
+		# increase to x1 (>= 1, and 2 if it was 1 and can be 2),
+		# decrease to x2 (>= 1 only if it was 2)
+		inc = ((rise & below_top) | done_act) & masks
+		dec = ((fall & above_0) | done_inh) & masks
+		X[0, elements, words] = (x1 & ~dec) | inc | (x2 & dec)
+		X[1, elements, words] = (x2 & ~inc & ~dec) | (inc & x1 & three)
+
+		delay_inh[:, elements, words] = count(delay_inh[:, elements, words], hold_inh & masks, done_inh & masks)
+		delay_act[:, elements, words] = count(delay_act[:, elements, words], hold_act & masks, done_act & masks)
+
+	def score(self, X, elements, words, masks, three, positions, kinds):
+		""" returns the planes (>= 1, >= 2) of the score of the leaf tables
+			(pairs x terms x leaves) of the elements
+		"""
+
+		positions = positions[elements]
+		kinds = kinds[elements]
+		at = words[:, None, None]
+		g1 = X[0][positions, at]
+		g2 = X[1][positions, at]
+		three = three[:, None, None]
+		if ((kinds==NOT) & (g2 & ~three & masks[:, None, None] != 0)).any():
+			raise ValueError('Can''t compute NOT, input is greater than max state')
+		highest = (g2 & three) | (g1 & ~g2 & ~three)
+		s1 = np.select([kinds==VAR, kinds==NOT, kinds==HIGHEST, kinds==NOT_HIGHEST],
+			[g1, np.where(three==ONES, ~g2, ~g1), highest, ~highest], ONES)
+		s2 = np.select([kinds==VAR, kinds==NOT, kinds==HIGHEST, kinds==NOT_HIGHEST],
+			[g2, ~g1 & three, highest, np.uint64(0)], ONES)
+		return np.bitwise_or.reduce(np.bitwise_and.reduce(s1, axis=2), axis=1), \
+			np.bitwise_or.reduce(np.bitwise_and.reduce(s2, axis=2), axis=1)
+
+
+def popcount(planes):
+	""" returns the number of set bits of each row of words """
+	if hasattr(np, 'bitwise_count'):
+		return np.bitwise_count(planes).sum(axis=1, dtype=np.int64)
+	return np.unpackbits(planes.view(np.uint8), axis=1).sum(axis=1, dtype=np.int64)
+
+def less(counter, delays):
+	""" returns the bits of the runs where the bit-sliced counter
+		(slices x pairs) is less than the delay of each pair
+	"""
+	lower = np.zeros(counter.shape[1], dtype=np.uint64)
+	equal = np.full(counter.shape[1], ONES)
+	for k in reversed(range(counter.shape[0])):
+		delay_bit = np.where((delays >> k) & 1, ONES, np.uint64(0))
+		lower |= equal & ~counter[k] & delay_bit
+		equal &= ~(counter[k] ^ delay_bit)
+	return lower
+
+def count(counter, increment, reset):
+	""" returns the bit-sliced counter (slices x pairs) incremented
+		in the increment bits and set to 0 in the reset bits
+	"""
+	counter = counter.copy()
+	carry = increment
+	for k in range(counter.shape[0]):
+		counter[k], carry = counter[k] ^ carry, counter[k] & carry
+		counter[k] &= ~reset
+	return counter
+
+def evaluate_terms(terms, X, mask, three):
+	""" returns the planes (>= 1, >= 2) of the score of a parsed rule (max over its terms)
+		Inputs:
+			terms : list of terms from parse_rule
+			X : (2 x elements x words) planes
+			mask : bits of the updated runs of each word
+			three : mask of the regulated element having 3 states
+	"""
+	planes = [evaluate_term(term, X, mask, three) for term in terms]
+	return join(np.bitwise_or, [p[0] for p in planes]), join(np.bitwise_or, [p[1] for p in planes])
+
+def join(op, planes):
+	""" returns the bitwise OR or AND of a list of arrays of words """
+	return op.reduce(np.array(planes, dtype=np.uint64))
+
+def evaluate_term(term, X, mask, three):
+	""" returns the planes of the score of one term of the words """
+
+	op = term[0]
+	if op=='var':
+		return X[0, term[1]], X[1, term[1]]
+	elif op=='not':
+		g1, g2 = X[0, term[1]], X[1, term[1]]
+		if (g2 & ~three & mask).any():
+			raise ValueError('Can''t compute NOT, input is greater than max state')
+		return (~g2 if three else ~g1), ~g1 & three
+	elif op in ('highest', 'not_highest'):
+		g1, g2 = X[0, term[1]], X[1, term[1]]
+		highest = (g2 & three) | (g1 & ~g2 & ~three)
+		return (highest, highest) if op=='highest' else (~highest, np.zeros_like(highest))
+	elif op=='and':
+		planes = [evaluate_term(t, X, mask, three) for t in term[1]]
+		return join(np.bitwise_and, [p[0] for p in planes]), join(np.bitwise_and, [p[1] for p in planes])
+	elif op=='pair':
+		must = [evaluate_term(t, X, mask, three) for t in term[1]]
+		enhance = [evaluate_term(t, X, mask, three) for t in term[2]]
+		# max of the min of the sufficient elements and the max of the enhancing ones,
+		# at most the highest state, and 0 if no sufficient element is present
+		present = join(np.bitwise_or, [p[0] for p in must])
+		score_1 = join(np.bitwise_and, [p[0] for p in must]) | join(np.bitwise_or, [p[0] for p in enhance])
+		score_2 = join(np.bitwise_and, [p[1] for p in must]) | join(np.bitwise_or, [p[1] for p in enhance])
+		return score_1 & present, score_2 & present & three
+	else:
+		raise ValueError('Unknown rule term: '+str(op))
@@ -0,0 +1,174 @@
+from array import array
+import numpy as np
+from scipy import sparse
+
+# largest number of states of a model the exact engine accepts
+MAX_STATES = 1 << 16
+# largest number of element updates the exploration of the states may take
+MAX_UPDATES = 1 << 22
+
+class TooManyStates(ValueError):
+	""" Raised when a model has too many states for the exact engine """
+
+def state_bound(state, update_list, depth=None):
+	""" returns an upper bound of the number of states reachable within depth updates
+		(default: any number), computed without exploring them: the product over
+		the elements with regulators of their numbers of values and of values of
+		the delay counter they use, and the number of sequences of at most depth updates
+	"""
+
+	bound = 1
+	for ele in update_list:
+		i = ele.get_index()
+		act, inh = ele.get_rules()
+		# only the elements with inhibitors alone spontaneously increase,
+		# the others spontaneously decay
+		delay = state.delay_act[i] if inh and not act else state.delay_inh[i]
+		bound *= max(state.max_state[i], state.initial[i]+1) * (delay+1)
+	if depth is not None:
+		paths = sequences = 1
+		for step in range(depth):
+			sequences *= len(update_list)
+			paths += sequences
+			if paths >= bound:
+				break
+		bound = min(bound, paths)
+	return bound
+
+class MarkovChain(object):
+	""" Define the Markov chain of the random asynchronous (ra) scheme of a model,
+		over the states (element values and delay counters) reachable from its
+		initial values. As in the other engines, every run starts with the
+		delay counters at 0.
+	"""
+
+	def __init__(self, state, update_list, max_states=MAX_STATES, depth=None, max_updates=MAX_UPDATES):
+		""" Build the transition matrix by exploring the reachable states,
+			updating each element with its compiled rules
+			Inputs:
+				state : ModelState of the model (values, max states, delays)
+				update_list : list of gateNode objects of the elements with regulators
+				max_states : raise a TooManyStates error if state_bound exceeds it
+				depth : only explore the states reachable within depth updates,
+					enough for run(simStep) with simStep <= depth (default: all states)
+				max_updates : raise a TooManyStates error if the exploration
+					may take more element updates (state_bound times the number
+					of elements with regulators)
+			The model is rejected before exploring any state.
+		"""
+
+		n = len(state.names)
+		self.__n = n
+		self.__depth = depth
+		self.__values = np.array(state.values, dtype=np.float64)
+
+		# each explored state is updated once per element of the update list
+		bound = state_bound(state, update_list, depth)
+		if bound > max_states or bound*len(update_list) > max_updates:
+			raise TooManyStates('The model may have more than '+str(min(bound, max_states))+
+				' reachable states, or need more than '+str(max_updates)+
+				' updates to explore them, too many for the exact engine')
+
+		# the update functions work on the state store, which is restored afterwards
+		stored = [array('l', x) for x in (state.values, state.curr_delay_act, state.curr_delay_inh)]
+
+		# a state is encoded as the bytes of the element values followed by
+		# the activation and inhibition delay counters
+		if max(list(state.initial) + list(state.delay_act) + list(state.delay_inh) + [0]) > 255 \
+			or max(list(state.max_state) + [0]) > 256:
+			raise ValueError('The exact engine only supports values and delays below 256')
+		start = bytes(list(state.initial) + 2*n*[0])
+		index = {start: 0}
+		states = [start]
+		# transitions (source and target states), at most one per element of each state
+		sources = np.empty(bound*len(update_list), dtype=np.int32)
+		targets = np.empty(bound*len(update_list), dtype=np.int32)
+		count = 0
+
+		# the states are explored by breadth-first search, level by level,
+		# the states of the last level (depth updates away) being left unexplored
+		k = 0
+		level = 0
+		level_end = 1
+		while k < len(states) and (depth is None or level < depth):
+			current = states[k]
+			state.values[:] = array('l', list(current[:n]))
+			state.curr_delay_act[:] = array('l', list(current[n:2*n]))
+			state.curr_delay_inh[:] = array('l', list(current[2*n:]))
+			for ele in update_list:
+				i = ele.get_index()
+				ele.update_compiled()
+				following = bytearray(current)
+				following[i] = state.values[i]
+				following[n+i] = state.curr_delay_act[i]
+				following[2*n+i] = state.curr_delay_inh[i]
+				following = bytes(following)
+				# restore the state for the next element
+				state.values[i] = current[i]
+				state.curr_delay_act[i] = current[n+i]
+				state.curr_delay_inh[i] = current[2*n+i]
+
+				if following not in index:
+					if len(states) >= bound:
+						self.restore(state, stored)
+						raise RuntimeError('More reachable states than the bound of the exact engine')
+					index[following] = len(states)
+					states.append(following)
+				sources[count] = k
+				targets[count] = index[following]
+				count += 1
+			k += 1
+			if k == level_end:
+				level += 1
+				level_end = len(states)
+
+		self.restore(state, stored)
+
+		# each element of the update list is picked with the same probability,
+		# the transposed matrix maps a distribution over states to the next one
+		m = len(states)
+		if update_list:
+			self.__transition = sparse.csr_matrix(
+				(np.full(count, 1.0/len(update_list)), (targets[:count], sources[:count])), shape=(m, m))
+		else:
+			self.__transition = sparse.identity(m, format='csr')
+		# element values of each state
+		self.__state_values = np.frombuffer(b''.join(states), dtype=np.uint8) \
+			.reshape(m, 3*n)[:, :n].astype(np.float64)
+
+	def restore(self, state, stored):
+		""" Restore the values and delay counters of the state store """
+		state.values[:], state.curr_delay_act[:], state.curr_delay_inh[:] = stored
+
+	def get_size(self):
+		""" returns the number of reachable states """
+		return self.__transition.shape[0]
+
+	def run(self, simStep, steps=None):
+		""" Compute the expected element values at each step
+			Inputs:
+				simStep : number of simulation steps
+				steps : sorted array of the steps to record (default: all steps)
+			Returns:
+				expected : (steps x elements) array of the expected values,
+					the row of step 0 holding the current values as in freq_sum
+		"""
+
+		if self.__depth is not None and simStep > self.__depth:
+			raise ValueError('The chain was explored for '+str(self.__depth)+' steps only')
+		steps = np.arange(simStep+1) if steps is None else steps
+		expected = np.zeros((len(steps), self.__n))
+		row = 0
+		if steps[0]==0:
+			expected[0] = self.__values
+			row = 1
+
+		# start from the initial values
+		distribution = np.zeros(self.get_size())
+		distribution[0] = 1.0
+		for step in range(1, simStep+1):
+			distribution = self.__transition @ distribution
+			if row < len(steps) and steps[row]==step:
+				expected[row] = distribution @ self.__state_values
+				row += 1
+		return expected
@@ -0,0 +1,384 @@
+import os
+import sys
+import json
+import openpyxl
+from collections import OrderedDict
+
+# Native model files hold the same table as the excel model files
+# (element, positive regulators, negative regulators, max states, delays,
+# initial values, expected values, ...), one row per line, each row being
+# a JSON list of the cell values of the row (null for an empty cell).
+# The first line is the header row. JSON keeps the types of the values,
+# so that converting to and from excel is lossless (e.g. an element named "1"
+# stays a string, while an initial value of 1 stays a number).
+NATIVE_EXTENSIONS = ('.jsonl',)
+
+# Default bound of the memory held by the cache of parsed model files
+CACHE_BYTES = 256 * 2**20
+
+
+def is_native_model(filename):
+	""" returns True if the file name has the extension of a native model file """
+	return os.path.splitext(str(filename))[1].lower() in NATIVE_EXTENSIONS
+
+def load_model(filename):
+	""" Load a model file, the format being chosen by the file extension
+		Inputs:
+			filename : an excel (.xlsx) or native (.jsonl) model file
+		Returns
+			wb : a ModelWorkbook holding a copy of the table of the model as wb.active,
+				to be edited and saved with save_model in either format
+	"""
+
+	return ModelWorkbook(ModelSheet([list(values) for values in model_rows(filename)]))
+
+def model_rows(filename):
+	""" returns the table of a model file as a tuple of rows (tuples of the cell values
+		without trailing empty cells, header row first), parsed once and then
+		shared through model_cache until the file changes
+	"""
+
+	return model_cache.get(filename)
+
+def read_model_rows(filename, max_col=None, min_row=2):
+	""" Stream the rows of a model file in a single pass, without loading the whole workbook
+		(excel files are opened in read-only mode)
+		Inputs:
+			filename : an excel (.xlsx) or native (.jsonl) model file
+			max_col (optional) : number of columns to read, shorter rows are padded with None,
+				default reads every column, without trailing empty cells
+			min_row (optional) : first row to read, default skips the header row
+		Returns
+			a generator of tuples of the cell values of each row
+	"""
+
+	if is_native_model(filename):
+		with open(filename) as f:
+			for row, line in enumerate(f, start=1):
+				if row < min_row:
+					continue
+				values = tuple(json.loads(line)) if line.strip() else ()
+				yield pad_row(values, max_col)
+		return
+
+	wb = openpyxl.load_workbook(filename, read_only=True)
+	try:
+		for values in wb.active.iter_rows(min_row=min_row, max_col=max_col, values_only=True):
+			yield pad_row(tuple(values), max_col)
+	finally:
+		wb.close()
+
+def pad_row(values, max_col):
+	""" returns the max_col first values padded with None, or the values without trailing empty cells """
+	if max_col is not None:
+		return values[:max_col] + (None,)*(max_col - len(values))
+	last = len(values)
+	while last > 0 and values[last-1] is None:
+		last -= 1
+	return values[:last]
+
+def save_model(wb, filename):
+	""" Save a workbook (openpyxl or ModelWorkbook) to a model file,
+		in the format chosen by the file extension
+	"""
+
+	if not isinstance(wb, ModelWorkbook):
+		wb = ModelWorkbook.from_sheet(wb.active)
+	wb.save(filename)
+
+def write_model_rows(filename, rows):
+	""" Write the rows of a model file in a single pass, in the format chosen by the file extension
+		(excel files are written in write-only mode), and cache its table
+		Inputs:
+			filename : an excel (.xlsx) or native (.jsonl) model file
+			rows : an iterable of the lists of cell values of each row, header row first
+	"""
+
+	# The written table is cached, as the next step of a pipeline usually loads it
+	table = []
+	if is_native_model(filename):
+		encode = json.JSONEncoder(default=str).encode
+		with open(filename, 'w') as f:
+			for values in rows:
+				line = encode(list(values))
+				f.write(line)
+				f.write('\n')
+				# the values as read back, e.g. numpy integers being written as strings
+				table.append(pad_row(tuple(json.loads(line)), None))
+	else:
+		wb = openpyxl.Workbook(write_only=True)
+		ws = wb.create_sheet()
+		for values in rows:
+			ws.append(list(values))
+			table.append(pad_row(tuple(values), None))
+		wb.save(filename)
+	model_cache.put(filename, table)
+
+def convert_model(source, target):
+	""" Convert a model file to the format of the target file name,
+		e.g. convert_model('model.xlsx', 'model.jsonl') and back
+	"""
+
+	save_model(load_model(source), target)
+
+
+class ModelCache(object):
+	""" Define a least recently used cache of parsed model files, keyed by
+		absolute path, size and modification time so that a changed file is parsed again,
+		and holding at most about max_bytes of tables
+	"""
+
+	def __init__(self, max_bytes=CACHE_BYTES):
+		self.max_bytes = max_bytes
+		self.entries = OrderedDict()
+		self.bytes = 0
+
+	def key(self, filename):
+		""" returns the absolute path of the file, and its key (path, size, modification time) """
+		path = os.path.abspath(filename)
+		stat = os.stat(path)
+		return path, (path, stat.st_size, stat.st_mtime_ns)
+
+	def get(self, filename):
+		""" returns the table of the model file, parsing it if it is not cached or has changed """
+		path, key = self.key(filename)
+		entry = self.entries.get(path)
+		if entry is not None and entry[0] == key:
+			self.entries.move_to_end(path)
+			return entry[1]
+		rows = tuple(read_model_rows(filename, min_row=1))
+		self.add(path, key, rows)
+		return rows
+
+	def put(self, filename, rows):
+		""" cache the table of a model file just saved, sparing its parsing on the next load """
+		path, key = self.key(filename)
+		self.add(path, key, tuple(tuple(values) for values in rows))
+
+	def add(self, path, key, rows):
+		""" cache the table of a model file, evicting the least recently used tables beyond max_bytes """
+		self.discard(path)
+		size = table_size(rows)
+		if size > self.max_bytes:
+			return
+		self.entries[path] = (key, rows, size)
+		self.bytes += size
+		while self.bytes > self.max_bytes:
+			self.bytes -= self.entries.popitem(last=False)[1][2]
+
+	def discard(self, filename):
+		""" remove the table of a model file from the cache """
+		entry = self.entries.pop(os.path.abspath(filename), None)
+		if entry is not None:
+			self.bytes -= entry[2]
+
+	def clear(self):
+		""" remove every table from the cache """
+		self.entries.clear()
+		self.bytes = 0
+
+	def resize(self, max_bytes):
+		""" set the memory bound of the cache, evicting tables beyond it """
+		self.max_bytes = max_bytes
+		while self.bytes > self.max_bytes:
+			self.bytes -= self.entries.popitem(last=False)[1][2]
+
+def table_size(rows):
+	""" returns an estimate of the memory held by a table of cell values """
+	return sys.getsizeof(rows) + sum(sys.getsizeof(values) + sum(sys.getsizeof(value) for value in values) for values in rows)
+
+# The cache shared by the simulator and the functions reading model files in this process
+model_cache = ModelCache()
+
+
+class ModelCell(object):
+	""" Define a cell of a ModelSheet, read and written through its value as an openpyxl cell
+	"""
+
+	__slots__ = ('sheet', 'row', 'column')
+
+	def __init__(self, sheet, row, column):
+		self.sheet = sheet
+		self.row = row
+		self.column = column
+
+	@property
+	def value(self):
+		return self.sheet.get_value(self.row, self.column)
+
+	@value.setter
+	def value(self, value):
+		self.sheet.set_value(self.row, self.column, value)
+
+
+class ModelSheet(object):
+	""" Define the table of a model file, with the subset of the
+		openpyxl worksheet interface used with model files
+		(cell, iter_rows, max_row, max_column)
+	"""
+
+	def __init__(self, rows=None):
+		# List of the rows, each a list of cell values, without trailing empty cells
+		self.rows = [] if rows is None else rows
+
+	@property
+	def max_row(self):
+		return max(len(self.rows), 1)
+
+	@property
+	def max_column(self):
+		return max([len(row) for row in self.rows] + [1])
+
+	def get_value(self, row, column):
+		""" returns the value of the cell at row, column (1-based), None if empty """
+		if row <= len(self.rows):
+			values = self.rows[row-1]
+			if column <= len(values):
+				return values[column-1]
+		return None
+
+	def set_value(self, row, column, value):
+		""" set the value of the cell at row, column (1-based), adding rows and columns as needed """
+		if row > len(self.rows):
+			self.rows.extend([] for x in range(row - len(self.rows)))
+		values = self.rows[row-1]
+		if column > len(values):
+			if value is None:
+				return
+			values.extend([None]*(column - len(values)))
+		values[column-1] = value
+
+	def cell(self, row, column, value=None):
+		""" returns the cell at row, column (1-based), setting its value if one is given (as openpyxl) """
+		if value is not None:
+			self.set_value(row, column, value)
+		return ModelCell(self, row, column)
+
+	def append(self, values):
+		""" add a row after the last row """
+		self.rows.append(list(values))
+
+	def iter_rows(self, min_row=None, max_row=None, min_col=None, max_col=None, values_only=False):
+		""" iterate through the rows as openpyxl, each row being a tuple of cells
+			(or of values if values_only) from min_col to max_col
+		"""
+
+		min_row = 1 if min_row is None else min_row
+		max_row = self.max_row if max_row is None else max_row
+		min_col = 1 if min_col is None else min_col
+		max_col = self.max_column if max_col is None else max_col
+		width = max_col - min_col + 1
+		for row in range(min_row, max_row+1):
+			if values_only:
+				values = self.rows[row-1][min_col-1:max_col] if row <= len(self.rows) else []
+				yield tuple(values) + (None,)*(width - len(values))
+			else:
+				yield tuple(ModelCell(self, row, column) for column in range(min_col, max_col+1))
+
+	@classmethod
+	def from_sheet(cls, ws):
+		""" returns a ModelSheet with the values of an openpyxl worksheet """
+		rows = [list(values) for values in ws.iter_rows(values_only=True)]
+		for values in rows:
+			while values and values[-1] is None:
+				values.pop()
+		return cls(rows)
+
+
+class ModelWorkbook(object):
+	""" Define a model file, holding a single sheet as wb.active
+	"""
+
+	def __init__(self, sheet=None):
+		self.active = ModelSheet() if sheet is None else sheet
+
+	@classmethod
+	def from_sheet(cls, ws):
+		""" returns a ModelWorkbook with the values of an openpyxl worksheet """
+		return cls(ModelSheet.from_sheet(ws))
+
+	def save(self, filename):
+		""" Save the workbook to a model file, in the format chosen by the file extension """
+		rows = self.active.rows
+		# Empty rows at the end are not saved, as in excel
+		last = len(rows)
+		while last > 0 and not any(value is not None for value in rows[last-1]):
+			last -= 1
+		write_model_rows(filename, rows[:last])
+
+
+class ModelDocument(object):
+	""" Define a model loaded once in memory, extended in place with groups of edges
+		as extend_model_file, and written to a file only when saved
+	"""
+
+	def __init__(self, rows):
+		self.sheet = ModelSheet(rows)
+
+		# Row of each element (1-based), as find_element_locations
+		self.locations = dict()
+		for row, values in enumerate(rows, start=1):
+			if not values or values[0] is None or str(values[0]).lower()=="variable name":
+				continue
+			self.locations[values[0]] = row
+
+	@classmethod
+	def load(cls, filename):
+		""" returns the document of a model file (excel or native) """
+		return cls([list(values) for values in model_rows(filename)])
+
+	def apply_edge_group(self, edge_group):
+		""" Extend the model with a group of edges, appending each regulator to the rule of the
+			regulated element, and adding the elements not yet in the model with initial value 1
+			in new rows after the last element, as extend_model_file
+			Inputs:
+				edge_group : list of edges, each [regulator, regulated, '+' or '-'],
+					after an identifier of the group, e.g. [0, ['1','2','+'], ['2','3','-']]
+			Returns
+				patch : the changes made, to undo with revert_edge_group
+		"""
+
+		sheet = self.sheet
+		patch = (len(sheet.rows), [], [])
+		rows, cells, added = patch
+		max_row = max(list(self.locations.values())+[1])+1
+
+		def set_value(row, column, value):
+			cells.append((row, column, sheet.get_value(row, column)))
+			sheet.set_value(row, column, value)
+
+		for e in edge_group[1:]:
+			# elements not yet in the model are added in a new row, initialized at 1
+			for name in e[:2]:
+				if name not in self.locations:
+					set_value(max_row, 1, name)
+					set_value(max_row, 6, 1)
+					self.locations[name] = max_row
+					added.append(name)
+					max_row += 1
+
+			# append the regulator to the regulators of the regulated element
+			column = 2 if e[2]=='+' else 3
+			row = self.locations[e[1]]
+			original = sheet.get_value(row, column)
+			original = original + ',' if original != None else ''
+			set_value(row, column, original+e[0])
+
+		return patch
+
+	def revert_edge_group(self, patch):
+		""" Undo the changes of apply_edge_group, the most recent first
+			Inputs:
+				patch : the changes returned by apply_edge_group
+		"""
+
+		rows, cells, added = patch
+		for row, column, value in reversed(cells):
+			self.sheet.set_value(row, column, value)
+		del self.sheet.rows[rows:]
+		for name in added:
+			del self.locations[name]
+
+	def save(self, filename):
+		""" Save the model to a file, in the format chosen by the file extension """
+		ModelWorkbook(self.sheet).save(filename)
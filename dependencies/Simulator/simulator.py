@@ -1,509 +1,1664 @@
-import re
-import random
-import openpyxl
-
-class Manager(object):
-	""" Define a model object
-	"""
-
-	def __init__(self, model_file, initial_col):
-		""" Initialize the model object using model information from the input file
-			Inputs:
-				model_file : an excel spreadsheet containing element names (col 1),
-					activators (col 2), inhibitors (col 3), max number of states (col 4),
-					and initial values (initial_col)
-		"""
-
-		self.__getElement = dict()
-		self.__updateList = list()
-		self.__initial = dict()
-
-		# Load the input file containing elements and regulators
-		# TODO: replace hardcoding of the column numbers
-		wb = openpyxl.load_workbook(model_file)
-		ws = wb.active
-
-		# Parse each row of the input file
-		# each row contains an element, its regulators, max states, and intial values
-		# TODO: also delays?
-		curr_row = 2
-		while ws.cell(row=curr_row, column=1).value != None:
-
-			# Get the max number of states for each element from the input file
-			# Default is 2
-			max_state = 3
-			if ws.cell(row=curr_row, column=4).value != None:
-				max_state = ws.cell(row=curr_row, column=4).value
-
-			# Get spontaneous activation/inhibition delays from input file
-			# Default is 1 for each
-			act_delay = 1
-			inh_delay = 1
-			if ws.cell(row=curr_row,column=5).value != None:
-				delays = [x.strip() for x in str(ws.cell(row=curr_row,column=5).value).split(',')]
-				if len(delays) == 2:
-					act_delay = int(delays[0])
-					inh_delay = int(delays[1])
-				else:
-					raise ValueError('Delays in input file must be in the format: \
-						[Activation Delay],[Inhibition Delay] \n For example: 1,1')
-
-			# Get initial value from input file
-			# Default is 1
-			val = 1
-			if ws.cell(row=curr_row,column=initial_col).value != None:
-				val = ws.cell(row=curr_row,column=initial_col).value
-
-			# Get names of the element (X), activators (A), and inhibitors (I)
-			# from input file
-			X = ws.cell(row=curr_row,column=1).value
-			A = ws.cell(row=curr_row,column=2).value
-			I = ws.cell(row=curr_row,column=3).value
-
-			X = '' if X==None else X.strip()
-			A = '' if A==None else A.strip()
-			I = '' if I==None else I.strip()
-
-			# Create a node object for this element
-			# and define initial values, regulators for this element
-			# in the model object (self)
-			ele = gateNode(X,A,I,val,max_state)
-			self.__initial[X] = val
-			self.__getElement[X] = ele
-			if A!='' or I!='':
-				self.__updateList += [ele]
-
-			curr_row += 1
-
-	def set_initial(self):
-		""" Set the current value of each element (node) in the model
-			to its initial value
-		"""
-
-		for name in self.__getElement:
-			self.__getElement[name].set_value(self.__initial[name])
-
-	def run_simulation(self, simtype, runs, simStep, outName, **kwargs):
-		""" Run a simulation!
-			Inputs
-				simtype : simulation scheme (not currently used)
-				TODO: implement more simulation schemes
-				runs : number of simulation runs
-				simStep : number of simulation steps
-				outName : name of output file
-		"""
-
-		# Will only write to output file if outMode!=3
-		outMode = kwargs["outMode"] if "outMode" in kwargs else 1
-
-		output_file = open(outName,'w')
-
-		# 'freq_sum' will keep a running sum of the value of each element
-		# across runs (frequency)
-		freq_sum = dict()
-		for key in self.__getElement:
-			freq_sum[key] = (simStep+1) * [0]
-			freq_sum[key][0] = self.__getElement[key].get_value() * runs
-
-		# Perform 'runs' number of simulation runs
-		for run in range(runs):
-			if outMode!=3:
-				output_file.write('Run #'+str(run)+'\n')
-
-			# Set elements to initial values
-			self.set_initial()
-
-			# 'memo' will store this element's values for each step
-			# in this run (memory)
-			memo = dict()
-			for key in self.__getElement:
-				memo[key] = [self.__getElement[key].get_value()]
-
-			# Perform 'simStep' number of simulation steps
-			for step in range(1,simStep+1):
-				# Update elements according to the simulation scheme
-				# TODO: define functions for more simulation schemes
-				self.ra_update()
-
-				for key in self.__getElement:
-					# store values for this step
-					memo[key] += [self.__getElement[key].get_value()]
-					# increment the sum of values across runs
-					freq_sum[key][step] += self.__getElement[key].get_value()
-
-			# Write values from this run to the output file
-			if outMode!=3:
-				for name in sorted(self.__getElement):
-					output_file.write(name+' '+' '.join([str(x) for x in memo[name]])+'\n')
-
-
-		# Write the sum of values across runs (frequency) to the output file
-		output_file.write('\nFrequency Summary:\n')
-		for name in sorted(self.__getElement):
-			# output_file.write(name+' '
-			# 	+' '.join([str(x) for x in freq_sum[name]])+'\n')
-			# also write max states for each element to output file
-			output_file.write(name+'|'+str(self.__getElement[key].get_max_state())+'|'
-				+' '+' '.join([str(x) for x in freq_sum[name]])+'\n')
-
-
-	def run_simulation_checker(self,simtype,simStep,outName):
-
-		output_file = open(outName,'w')
-		output_file.write('# time ')
-		for key in sorted(self.__getElement):
-			output_file.write(key+'_0 '+key+'_1 ')
-		output_file.write('step\n')
-
-		self.print_value(output_file,0)
-		for step in range(1,simStep+1):
-			self.ra_update()
-			self.print_value(output_file,step)
-
-		output_file.close()
-
-
-	def ra_update(self):
-		""" Update all elements, using the random asynchronous (ra) scheme
-		"""
-
-		update_ele = random.choice(self.__updateList)
-		update_ele.update(self.__getElement)
-
-	def print_value(self,output_file,step):
-
-		output_file.write(str(step)+'  ')
-		for key in sorted(self.__getElement):
-			val = self.__getElement[key].get_value()
-			output_file.write(str(val&1)+' ')
-			output_file.write(str((val&2)>>1)+' ')
-		output_file.write(str(step)+'\n')
-
-
-####################################################################
-class gateNode(object):
-	""" Define a node object containing an element, regulators, and states
-	"""
-	# TODO: create constants for default values
-	def __init__(self,X,A,I,curr_val,max_state=3,delay_act=3,delay_inh=3):
-		# the regulated (current) element
-		self.__regulated = X.strip()
-		# activator of the current element
-		self.__act = re.sub('\s','',A)
-		# inhibitor of the current element
-		self.__inh = re.sub('\s','',I)
-		# list of the element and its regulators
-		self.__name_list = self.create_name_list(X.strip(),A.strip(),I.strip())
-		# dictionary mapping element names to their values
-		self.__name_to_value = dict()
-		# number of discrete levels (states) for each element
-		self.__max_state = int(max_state)
-		# current element value
-		self.__curr_val = curr_val
-		# delay values for spontaneous activation and inhibition
-		self.__delay_act = delay_act
-		self.__delay_inh = delay_inh
-		# current delay values for spontaneous activation and inhibition
-		self.__curr_delay_act = 0
-		self.__curr_delay_inh = 0
-
-	##### Get functions #####
-
-	def get_name(self):
-		return self.__regulated
-
-	def get_max_state(self):
-		return self.__max_state
-
-	def get_name_list(self):
-		return self.__name_list
-
-	def get_value(self):
-		return self.__curr_val
-
-	#########################
-
-	def set_value(self,val):
-		""" Set this element's current value """
-		self.__curr_val = val
-
-	def create_name_list(self,X,A,I):
-		""" Create a list of this element, activator, and inhibitor names """
-		names = set([X])
-		act_set = set(re.findall(r'[\.\w_@\*\#/;]+',A))
-		inh_set = set(re.findall(r'[\.\w_@\*\#/;]+',I))
-		# TODO: subtracting names?
-		return sorted(list(act_set-names)) + sorted(list(inh_set-act_set-names)) + list(names)
-
-	def update(self,getElement):
-		""" Update this element """
-		self.__name_to_value.clear()
-		for name in self.__name_list:
-			self.__name_to_value[name] = getElement[name].get_value()
-		self.__curr_val = self.evaluate()
-
-	def evaluate(self):
-		""" determine the value of the regulated element
-			based on values of the inhibitors and activators
-		"""
-
-		# calculate activation and inhibition scores
-		y_act = self.eval_act(self.__act,0)
-		y_inh = self.eval_inh(self.__inh,0)
-
-		# define current element value, max states, and max delays for code readability
-		X_curr = int(self.__name_to_value[self.__regulated])
-		N = self.__max_state-1
-		D_act = self.__delay_act
-		D_inh = self.__delay_inh
-
-		# determine next value of the regulated element,
-		# based on the type of regulators and activation/inhibition scores
-		if (self.__act) and (not self.__inh):
-			# this element has only positive regulators
-			# set the next value to increase if activation > 0,
-			# but don't increase beyond the maximum state.
-			# if there is no activation, the value should spontaneously decay,
-			# but not below 0
-			if (y_act > 0) and (X_curr < N):
-				X_next = X_curr + 1
-			elif (y_act > 0) and (X_curr == N):
-				X_next = X_curr
-			elif (y_act == 0) and (X_curr > 0):
-				# spontaneously decay (inhibition)
-				if self.__curr_delay_inh < D_inh:
-					# hold current value and increment delay
-					X_next = X_curr
-					self.__curr_delay_inh += 1
-				else:
-					# decay and reset delay
-					X_next = X_curr - 1
-					self.__curr_delay_inh = 0
-			elif (y_act == 0) and (X_curr == 0):
-				X_next = X_curr
-		elif (not self.__act) and (self.__inh):
-			# this element has only negative regulators
-			# set the next value to decrease if inhibition > 0,
-			# but don't decrease below 0.
-			# if there is no inhibition, the value should spontaneously increase,
-			# but not beyond the maximum state.
-			if (y_inh > 0) and (X_curr > 0):
-				X_next = X_curr - 1
-			elif (y_inh > 0) and (X_curr == 0):
-				X_next = X_curr
-			elif (y_inh == 0) and (X_curr < N):
-				# spontaneously increase
-				if self.__curr_delay_act < D_act:
-					# hold current value and increment delay
-					X_next = X_curr
-					self.__curr_delay_act += 1
-				else:
-					# increase and reset delay
-					X_next = X_curr + 1
-					self.__curr_delay_act = 0
-			elif (y_inh == 0) and (X_curr == N):
-				X_next = X_curr
-		elif (self.__act) and (self.__inh):
-			# this element has both activators and inhibitors
-			# increase the value if activation > inhibition,
-			# decrease if activation <= inhibition,
-			# but not above/below the bounds of the max/min states.
-			# Note: this means if activation == inhibition,
-			# the value spontaneously decays.
-			if 	(y_act > y_inh) and (X_curr < N):
-				X_next = X_curr + 1
-			elif (y_act > y_inh) and (X_curr == N):
-				X_next = X_curr
-			elif (y_act <= y_inh) and (X_curr > 0):
-				# spontaneously decay (inhibition)
-				if self.__curr_delay_inh < D_inh:
-					# hold current value and increment delay
-					X_next = X_curr
-					self.__curr_delay_inh += 1
-				else:
-					# decay and reset delay
-					X_next = X_curr - 1
-					self.__curr_delay_inh = 0
-			elif (y_act <= y_inh) and (X_curr == 0):
-				X_next = X_curr
-
-		elif (not self.__act) and (not self.__inh):
-			# this element has no regulators; hold its value
-			X_next = X_curr
-
-		# return the next state,
-		# with a redundant sort to keep X_next within the state value bounds
-		return sorted([0, X_next , N])[1]
-
-	def eval_inh(self,inh_rule,layer):
-		""" returns an int y_sum indicating the inhibition score
-			calculated based on the value of the inhibitors
-			Inputs:
-				inh_rule : inhibitor function notation
-				layer : set != 0 when the function is called recursively
-		"""
-
-		# Only calculate the score if there are actually inhibitors for this element
-		if inh_rule:
-			# create a list of inhibitors from influence set notation
-			# inhibitors are separated by commas (outside parentheses)
-			inh_list = self.split_comma_outside_parentheses(inh_rule)
-			y_sum = list()
-
-			# parse inhibitors, first checking for groups of elements in ()
-			for inh_element in inh_list:
-				if inh_element[0]=='(' and inh_element[-1]==')':
-					# this is and AND operation, all inhibitors must be present
-					# construct a list of the values of each element, then perform discrete AND (min)
-					y_and = [int(x) \
-						for and_entity in self.split_comma_outside_parentheses(inh_element[1:-1]) \
-						for x in self.eval_inh(and_entity,1)]
-					y_sum += [min(y_and)]
-				else:
-					# single inhibitor
-					# confirm there are no commas separating inhibitors
-					assert(inh_element.find(',')==-1)
-					# TODO: add code below for highest state inhibitors?
-					if inh_element[-1]=='+':
-					# highest state inhibitor
-					# increment the sum, calculating the increment value by comparing to the max state
-						if inh_element[0]=='!':
-							y_sum += int(not self.__name_to_value[inh_element[1:-1]]==self.__max_state-1)
-						else:
-							y_sum += int(self.__name_to_value[inh_element[:-1]]==self.__max_state-1)*2
-					elif inh_element[0]=='!':
-						y_sum += [int(self.discrete_not(self.__name_to_value[inh_element[1:]],self.__max_state-1))]
-					else:
-
-					# calculate the value of the sum based on the value of the inhibitor
-					# using the state name to value mapping (__name_to_value dictionary)
-						y_sum += [int(self.__name_to_value[inh_element])]
-
-			if layer==0:
-				# TODO: initializer values for inhibitors?
-				return max(y_sum)
-			else:
-				return y_sum
-
-	def eval_act(self,act_rule,layer):
-		""" returns a string list y_sum indicating the activation score,
-			calculated based on the value of the activators
-			Inputs:
-				act_rule : activator function notation
-				layer : set != 0 when the function is called recursively
-		"""
-
-		# Only calculate the score if there are actually activators for this element
-		if act_rule:
-			# TODO: define N = self.__max_state-1 to make more readable
-
-			# create a list of activators from influence set notation
-			# activators are separated by commas (outside parentheses)
-			act_list = self.split_comma_outside_parentheses(act_rule)
-
-			y_init = list()
-			y_sufficient = list()
-			# TODO: explain why score is initialized as a list
-			y_sum = list()
-			y_must = list()
-			y_enhance = list()
-			# parse activators, first checking for elements in {},  ()
-			for act_element in act_list:
-				if act_element[0]=='{' and act_element[-1]=='}':
-					# this is an initializer
-					# confirm that this is layer 0
-					assert(layer==0)
-					# define as an initializer, evaluating only the expression within the brackets
-					y_sum += self.eval_act(act_element[1:-1],1)
-				elif act_element[0]=='{' and act_element[-1]==']':
-					# this is a necessary pair
-					# Find the cut point between {} and []
-					parentheses = 0
-					cut_point = 0
-					for index in range(len(act_element)):
-						if act_element[index]=='{':
-							parentheses += 1
-						elif act_element[index]=='}':
-							parentheses -= 1
-						if parentheses==0:
-							cut_point = index
-							break
-					# define the first part as the sufficient element
-					y_must += self.eval_act(act_element[1:cut_point],1)
-					# define the second part as the enhancing/strengthening element
-					y_enhance += self.eval_act(act_element[cut_point+2:-1],1)
-					# increment the score according to the values of both the sufficient and enhancing elements
-					# but use the 'sorted' expression to keep the value below the max state value
-					# TODO: check min(min(y_must),max(y_enhance))
-					y_sum += [0 if all([y==0 for y in y_must])==True \
-						else sorted([0, int(max(min(y_must),max(y_enhance))), self.__max_state-1])[1]]
-				elif act_element[0]=='(' and act_element[-1]==')':
-					# this is an AND operation, all activators must be present
-					# construct a list of the values of each element, then perform discrete AND (min)
-					y_and = [int(x) \
-						for and_entity in self.split_comma_outside_parentheses(act_element[1:-1]) \
-						for x in self.eval_act(and_entity,1)]
-					y_sum += [min(y_and)]
-				else:
-					# single activator
-					# confirm that there are no commas separating activators
-					assert(act_element.find(',')==-1)
-					# calculate the value of the score based on the value of the activator
-					# using the state name to value mapping (__name_to_value dictionary)
-					if act_element[-1]=='+':
-						# this is a highest state activator
-						# increment the score only if this activator is at the max state
-						if act_element[0]=='!':
-							y_sum += [int(not self.__name_to_value[act_element[1:-1]]==self.__max_state-1)]
-						else:
-							# TODO: Why multiplying by 2? check Description.pptx for scoring info
-							y_sum += [int(self.__name_to_value[act_element[:-1]]==self.__max_state-1)*2]
-					elif act_element[0]=='!':
-						y_sum += [int(self.discrete_not(self.__name_to_value[act_element[1:]],self.__max_state-1))]
-					else:
-						y_sum += [int(self.__name_to_value[act_element])]
-
-			if layer==0:
-				# check for initializers and value of intializers
-				if (self.__name_to_value[self.__regulated]==0
-					and len(y_init)!=0
-					and all([y==0 for y in y_init])==True):
-					return 0
-				else:
-					return max(y_sum)
-
-			else:
-				return y_sum
-
-	def discrete_not(self, x, N):
-		"""
-		"""
-		if N >= x:
-			return (N - x)
-		else:
-			raise ValueError('Can''t compute NOT, input is greater than max state')
-
-	def split_comma_outside_parentheses(self, sentence):
-		final_list = list()
-		parentheses = 0
-		start = 0
-		for index in range(len(sentence)):
-			char = sentence[index]
-			if index==len(sentence)-1:
-				final_list.append(sentence[start:index+1])
-			elif char=='(' or char=='{' or char=='[':
-				parentheses += 1
-			elif char==')' or char=='}' or char==']':
-				parentheses -= 1
-			elif (char==',' and parentheses==0):
-				final_list.append(sentence[start:index])
-				start = index+1
-		return final_list
-
-	# TODO: add the function to generate a model expression (same as in utility_function.py)
-
-# TODO: define a main function?
-# def main():
-
-# if __name__=="__main__":
-# 	main()
+import re
+import random
+import warnings
+import csv
+from time import perf_counter
+from statistics import NormalDist
+import numpy as np
+from array import array
+from operator import add, itemgetter
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from .vectorized import VectorizedEngine
+from .bitplane import BitplaneEngine
+from .exact import MarkovChain, TooManyStates, MAX_STATES
+from .trace import TraceWriter, trace_dtype
+from .modelfile import model_rows, pad_row
+
+class Manager(object):
+	""" Define a model object
+	"""
+
+	def __init__(self, model_file, initial_col, seed=None):
+		""" Initialize the model object using model information from the input file
+			Inputs:
+				model_file : an excel spreadsheet (or native .jsonl model file, see modelfile.py)
+					containing element names (col 1), activators (col 2), inhibitors (col 3),
+					max number of states (col 4), and initial values (initial_col)
+				seed (optional) : seed of the random stream of this model (see seed())
+		"""
+
+		self.init_empty()
+		if seed is not None:
+			self.seed(seed)
+
+		# Get the rows of the input file containing elements and regulators,
+		# streamed in a single pass (excel files are opened read-only)
+		# unless the file is in the cache of parsed model files
+		# TODO: replace hardcoding of the column numbers
+		width = max(5, initial_col)
+		rows = model_rows(model_file)
+
+		# Parse each row of the input file, up to the first row without an element
+		# each row contains an element, its regulators, max states, and intial values
+		for row in rows[1:]:
+			row = pad_row(row, width)
+			if row[0] == None:
+				break
+			self.add_element(row[0], row[1], row[2], row[3], row[4], row[initial_col-1])
+
+		self.compile_rules()
+
+	@classmethod
+	def from_spec(cls, spec):
+		""" Initialize the model object from a dictionary of element specifications
+			Inputs:
+				spec : dictionary mapping each element name to a tuple
+					(activators, inhibitors, max states, delays, initial value),
+					where activators and inhibitors are rules in the notation of the
+					input file or lists of regulator names, and None selects the
+					same defaults as an empty cell of the input file
+		"""
+
+		model = cls.__new__(cls)
+		model.init_empty()
+		for X, (A, I, max_state, delays, val) in spec.items():
+			model.add_element(X, A, I, max_state, delays, val)
+		model.compile_rules()
+		return model
+
+	@classmethod
+	def from_graph(cls, G, initial_values=None, max_state=None):
+		""" Initialize the model object from a directed graph, giving the same model
+			as network_to_excel followed by loading the file
+			Inputs:
+				G : nx.DiGraph with a 'typ' attribute on each edge,
+					'+' for activation and '-' for inhibition
+				initial_values : dictionary mapping element names to initial values
+					(default 1)
+				max_state : number of states of every element (default 3)
+		"""
+
+		if initial_values is None:
+			initial_values = dict()
+
+		# Collect the regulators of each element, with the elements and
+		# regulators in the order of the edges of the graph
+		regulators = dict()
+		for source, target in G.edges():
+			for node in (source, target):
+				if str(node) not in regulators:
+					regulators[str(node)] = ([], [])
+			regulators[str(target)][0 if G[source][target]['typ']=='+' else 1].append(str(source))
+		# Elements without any edges come last
+		for node in G.nodes():
+			if str(node) not in regulators:
+				regulators[str(node)] = ([], [])
+
+		spec = dict()
+		for X, (A, I) in regulators.items():
+			spec[X] = (','.join(A), ','.join(I), max_state, None,
+				initial_values[X] if X in initial_values else None)
+		return cls.from_spec(spec)
+
+	def init_empty(self):
+		""" Initialize a model object without elements """
+
+		self.__getElement = dict()
+		self.__updateList = list()
+		# element names are interned to integer positions in the state store,
+		# which holds the values, max states and delays of all elements
+		self.__state = ModelState()
+		# random stream used to pick the elements to update
+		self.__rng = random
+		# number of runs performed by the last simulation
+		self.__runs_used = 0
+		# smallest simStep for which the exact engine rejected the model, and the error,
+		# for each max_states, until the model changes
+		self.__exact_rejected = dict()
+
+	def seed(self, seed=None):
+		""" Give this model its own random stream, so that its simulations
+			are reproducible independently of the random module
+			Inputs:
+				seed : seed of the stream, or None to use the random module again
+		"""
+
+		self.__rng = random if seed is None else random.Random(seed)
+
+	def add_element(self, X, A, I, max_state=None, delays=None, val=None):
+		""" Add an element to the model, using the same defaults as an empty
+			cell of the input file for the max states, delays, and initial value
+			Inputs:
+				X : element name
+				A : activators, as a rule or a list of names
+				I : inhibitors, as a rule or a list of names
+				max_state : max number of states
+				delays : spontaneous activation and inhibition delays,
+					as '[Activation Delay],[Inhibition Delay]'
+				val : initial value
+		"""
+
+		# Get the max number of states for each element
+		# Default is 2
+		if max_state == None:
+			max_state = 3
+
+		# Get spontaneous activation/inhibition delays
+		# Default is 1 for each
+		# TODO: also delays?
+		act_delay = 1
+		inh_delay = 1
+		if delays != None:
+			delays = [x.strip() for x in str(delays).split(',')]
+			if len(delays) == 2:
+				act_delay = int(delays[0])
+				inh_delay = int(delays[1])
+			else:
+				raise ValueError('Delays in input file must be in the format: \
+					[Activation Delay],[Inhibition Delay] \n For example: 1,1')
+
+		# Get initial value
+		# Default is 1
+		if val == None:
+			val = 1
+
+		# Get names of the element (X), activators (A), and inhibitors (I)
+		if isinstance(A, (list, tuple)):
+			A = ','.join(A)
+		if isinstance(I, (list, tuple)):
+			I = ','.join(I)
+		X = '' if X==None else X.strip()
+		A = '' if A==None else A.strip()
+		I = '' if I==None else I.strip()
+
+		# Create a node object for this element
+		# and define initial values, regulators for this element
+		# in the model object (self)
+		ele = gateNode(X,A,I,val,max_state,state=self.__state)
+		self.__getElement[X] = ele
+		self.__exact_rejected.clear()
+		if A!='' or I!='':
+			self.__updateList += [ele]
+
+	def compile_rules(self):
+		""" Compile the activation/inhibition rules of each element
+			against the positions of its regulators in the state store
+		"""
+
+		for ele in self.__updateList:
+			ele.compile()
+
+	def apply_edge_group(self, edge_group):
+		""" Extend the model in place with a group of edges, giving the same model
+			as extend_model_file followed by loading the extended file,
+			only recompiling the rules of the regulated elements
+			Inputs:
+				edge_group : list of edges, each [regulator, regulated, '+' or '-'],
+					after an identifier of the group, e.g. [0, ['1','2','+'], ['2','3','-']]
+			Returns
+				patch : the changes made, to undo with revert_edge_group
+		"""
+
+		size = len(self.__state.names)
+		rules = dict()
+		for e in edge_group[1:]:
+			# elements not yet in the model are added without regulators,
+			# with initial value 1
+			for name in e[:2]:
+				if name not in self.__getElement:
+					self.add_element(name, None, None, val=1)
+
+			# append the regulator to the rule of the regulated element
+			ele = self.__getElement[e[1]]
+			act, inh = ele.get_rules()
+			if e[1] not in rules:
+				rules[e[1]] = (act, inh)
+			if e[2]=='+':
+				act = act+','+e[0] if act!='' else e[0]
+			else:
+				inh = inh+','+e[0] if inh!='' else e[0]
+			ele.set_rules(act, inh)
+
+		for name, (act, inh) in rules.items():
+			ele = self.__getElement[name]
+			ele.compile()
+			# elements that had no regulators can now be updated
+			if act=='' and inh=='':
+				self.insert_update(ele)
+
+		self.__exact_rejected.clear()
+		self.reset()
+		return (size, rules)
+
+	def revert_edge_group(self, patch):
+		""" Undo the changes of apply_edge_group, the most recent first
+			Inputs:
+				patch : the changes returned by apply_edge_group
+		"""
+
+		size, rules = patch
+		for name, (act, inh) in rules.items():
+			ele = self.__getElement[name]
+			ele.set_rules(act, inh)
+			if act=='' and inh=='':
+				self.__updateList.remove(ele)
+			elif ele.get_index() < size:
+				ele.compile()
+
+		# remove the elements added by the edge group
+		for name in self.__state.names[size:]:
+			del self.__getElement[name]
+		self.__state.truncate(size)
+		self.__exact_rejected.clear()
+		self.reset()
+
+	def insert_update(self, ele):
+		""" Add an element to the update list, keeping the list in the order of
+			the positions of the elements (the order of the rows of the input file)
+		"""
+
+		i = len(self.__updateList)
+		while i > 0 and self.__updateList[i-1].get_index() > ele.get_index():
+			i -= 1
+		self.__updateList.insert(i, ele)
+
+	def reset(self):
+		""" Set the elements to their initial values and clear the
+			delay counters, as when the model is loaded
+		"""
+
+		self.set_initial()
+		state = self.__state
+		state.curr_delay_act[:] = array('l', len(state.names)*[0])
+		state.curr_delay_inh[:] = array('l', len(state.names)*[0])
+
+	def get_runs_used(self):
+		""" returns the number of runs performed by the last simulation,
+			fewer than requested when an adaptive simulation converged early
+		"""
+		return self.__runs_used
+
+	def get_values(self):
+		""" returns the current value vector as a list """
+		return self.__state.values.tolist()
+
+	def set_values(self, values):
+		""" Set the current value vector """
+		self.__state.values[:] = array('l', values)
+
+	def set_initial(self):
+		""" Set the current value of each element (node) in the model
+			to its initial value
+		"""
+
+		self.__state.values[:] = self.__state.initial
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		# the random module itself can't be pickled
+		if state['_Manager__rng'] is random:
+			state['_Manager__rng'] = None
+		return state
+
+	def __setstate__(self, state):
+		""" Restore a pickled model and compile its rules again """
+		self.__dict__.update(state)
+		if self.__rng is None:
+			self.__rng = random
+		for ele in self.__updateList:
+			ele.compile()
+
+	def run_simulation(self, simtype, runs, simStep, outName, **kwargs):
+		""" Run a simulation!
+			Inputs
+				simtype : simulation scheme, 'ra' to update one random element per step
+					(random asynchronous), 'round' to update every element once per step
+					in a random order, or 'sync' to update every element at once
+					from the values of the previous step (synchronous)
+				runs : number of simulation runs
+				simStep : number of simulation steps
+				outName : name of output file
+				engine (optional) : 'scalar' (default) to simulate one run at a time,
+					'vectorized' to advance all runs together as a (runs x elements) matrix,
+					'bitplane' to advance them 64 at a time as bits of machine words,
+					for models whose elements have 2 or 3 states (see bitplane.py),
+					or 'exact' to compute the expected values from the Markov chain
+					of the model (see exact.py), scaled by runs as if averaged over
+					infinitely many runs; no run is traced (see simulate for larger models)
+				workers (optional) : number of processes to share the runs between (default 1)
+				trace_format (optional) : 'text' (default), or 'binary' to write a
+					memory-mappable binary trace (see trace.py) holding the values of
+					each run at each step, or only the frequency summary if outMode==3
+				tolerance (optional) : stop once the score of the end values is known
+					within this tolerance, with runs as the maximum number of runs,
+					see simulate (also min_runs, batch and confidence)
+				record (optional) : steps to record, see recorded_steps (default 'all');
+					the output file then holds the values of these steps only,
+					the Frequency Summary listing them after its header
+			Returns
+				freq_sum : list of the sum of the value vector across runs at each step
+		"""
+
+		# Will only write to output file if outMode!=3
+		outMode = kwargs["outMode"] if "outMode" in kwargs else 1
+		trace_format = kwargs["trace_format"] if "trace_format" in kwargs else 'text'
+
+		# output the elements in sorted order, using their positions in the state store
+		names = sorted(self.__getElement)
+		positions = [self.__state.index[name] for name in names]
+		record = kwargs["record"] if "record" in kwargs else 'all'
+		steps = recorded_steps(simStep, record)
+
+		if trace_format=='binary':
+			max_states = [self.__state.max_state[pos] for pos in positions]
+			writer = TraceWriter(outName, names, max_states, runs, len(steps),
+				kind='trace' if outMode!=3 else 'frequency', recorded=steps.tolist() if record!='all' else None)
+			freq_sum = self.simulate(runs, simStep, **dict(kwargs, simtype=simtype,
+				trace=(lambda run, memo: writer.write_run(run, memo[:, positions])) if outMode!=3 else None))
+			if outMode==3:
+				writer.write_run(0, np.array(freq_sum)[:, positions])
+			writer.close(self.__runs_used)
+			return freq_sum
+		elif trace_format!='text':
+			raise ValueError('Unknown trace format: '+str(trace_format))
+
+		output_file = open(outName,'w')
+
+		def write_trace(run, memo):
+			# Write values from this run to the output file
+			output_file.write('Run #'+str(run)+'\n')
+			self.write_run(output_file, memo, names, positions)
+
+		freq_sum = self.simulate(runs, simStep, **dict(kwargs, simtype=simtype,
+			trace=write_trace if outMode!=3 else None))
+
+		self.write_frequency_summary(output_file, freq_sum, names, positions,
+			steps=steps if record!='all' else None)
+		output_file.close()
+		return freq_sum
+
+	def simulate(self, runs, simStep, **kwargs):
+		""" Run a simulation in memory. Every run starts from the initial values,
+			with the delay counters at 0, so that the runs are independent
+			Inputs
+				runs : number of simulation runs
+				simStep : number of simulation steps
+				simtype (optional) : simulation scheme, 'ra' (default), 'round' or 'sync',
+					see run_simulation
+				engine (optional) : 'scalar' (default), 'vectorized', 'bitplane' or 'exact', see run_simulation
+				workers (optional) : number of processes to share the runs between (default 1)
+				trace (optional) : function called as trace(run, memo) after each run,
+					in run order, with memo the (steps x value vector) array of values
+				stats (optional) : RunningStats to which the value vector at the end
+					of each run is added
+				tolerance (optional) : simulate adaptively, in batches of runs, until the
+					confidence interval of the score of the end values (the distance to
+					any expected values, see RunningStats.score_half_width) is narrower
+					than +/- tolerance, with runs as the maximum number of runs
+				min_runs (optional) : minimum number of runs of an adaptive simulation (default 10)
+				batch (optional) : number of runs between convergence checks (default min_runs)
+				confidence (optional) : confidence level of the interval (default 0.95)
+				steady_state (optional) : end a run as soon as it reaches an absorbing
+					state, where no update can change the values or the delay counters,
+					filling its remaining steps with its final values (default False).
+					The results have the same distribution, but the random stream is
+					consumed differently than without this option. With the deterministic
+					'sync' scheme, a run also ends once it repeats a state, its remaining
+					steps following the cycle.
+				record (optional) : steps whose values are kept in freq_sum and in the
+					memo of each run, see recorded_steps (default 'all')
+				profile (optional) : ElementProfile (see new_profile) counting the updates
+					of each element and timing them, only with the scalar engine
+				max_states (optional) : largest number of states the exact engine explores
+					(default exact.MAX_STATES), models that may have more being
+					rejected before exploring any state (see exact.state_bound)
+				fallback (optional) : engine simulating the runs instead, with a warning,
+					when the exact engine rejects the model (default 'vectorized'),
+					None to raise the error. The rejection is remembered until the model changes.
+			Returns
+				freq_sum : list of the sum of the value vector across runs at each recorded step,
+					see get_runs_used for the number of runs
+		"""
+
+		engine = kwargs["engine"] if "engine" in kwargs else 'scalar'
+		workers = kwargs["workers"] if "workers" in kwargs else 1
+		trace = kwargs["trace"] if "trace" in kwargs else None
+		stats = kwargs["stats"] if "stats" in kwargs else None
+		tolerance = kwargs["tolerance"] if "tolerance" in kwargs else None
+		steady_state = kwargs["steady_state"] if "steady_state" in kwargs else False
+		simtype = kwargs["simtype"] if "simtype" in kwargs else 'ra'
+		steps = recorded_steps(simStep, kwargs["record"] if "record" in kwargs else 'all')
+		profile = kwargs["profile"] if "profile" in kwargs else None
+
+		values = self.__state.values
+		schemes = {'ra': self.ra_update, 'round': self.round_update, 'sync': self.sync_update}
+		if simtype not in schemes:
+			raise ValueError('Unknown simulation scheme: '+str(simtype))
+
+		if profile is not None and engine!='scalar':
+			raise ValueError('Only the scalar engine can profile the updates of elements')
+
+		if engine=='exact':
+			if trace is not None:
+				raise ValueError('The exact engine computes expected values, it has no runs to trace')
+			if simtype!='ra':
+				raise ValueError('The exact engine only supports the ra simulation scheme')
+			max_states = kwargs["max_states"] if "max_states" in kwargs else MAX_STATES
+			fallback = kwargs["fallback"] if "fallback" in kwargs else 'vectorized'
+			# a model rejected for simStep steps is rejected for more steps
+			rejected = self.__exact_rejected.get(max_states)
+			if rejected is None or simStep < rejected[0]:
+				try:
+					chain = MarkovChain(self.__state, self.__updateList, max_states, depth=simStep)
+					rejected = None
+				except TooManyStates as error:
+					rejected = (simStep, str(error))
+					self.__exact_rejected[max_states] = rejected
+					if fallback is not None:
+						warnings.warn(rejected[1]+'; simulating the runs with the '+fallback+' engine instead')
+			if rejected is not None:
+				if fallback is None:
+					raise TooManyStates(rejected[1])
+				# simulate the runs instead
+				return self.simulate(runs, simStep, **dict(kwargs, engine=fallback))
+			self.__runs_used = runs
+			freq_sum = runs * chain.run(simStep, steps)
+			return freq_sum.tolist()
+
+		if tolerance is not None:
+			return self.simulate_adaptive(runs, simStep, **kwargs)
+
+		self.__runs_used = runs
+
+		if workers > 1 and runs > 1:
+			return self.simulate_parallel(runs, simStep, **kwargs)
+
+		if engine in ('vectorized', 'bitplane'):
+			Engine = VectorizedEngine if engine=='vectorized' else BitplaneEngine
+			freq_sum, memo, end_values = Engine(self.__state,self.__updateList).run(
+				runs, simStep, trace=(trace is not None),
+				rng=np.random.default_rng(self.__rng.getrandbits(64)),
+				steady_state=steady_state, simtype=simtype, steps=steps)
+			if runs:
+				values[:] = array('l', end_values[-1].tolist())
+			if stats is not None:
+				stats.add(end_values)
+			if trace is not None:
+				for run in range(runs):
+					trace(run, memo[:, run, :])
+			return freq_sum.tolist()
+		elif engine!='scalar':
+			raise ValueError('Unknown simulation engine: '+str(engine))
+
+		# 'freq_sum' will keep a running sum of the value of each element
+		# across runs (frequency), as one row of the value vector per recorded step
+		freq_sum = [len(values) * [0] for step in steps]
+		# row of each step in freq_sum, -1 if the step is not recorded
+		rows = np.full(simStep+1, -1)
+		rows[steps] = np.arange(len(steps))
+		rows = rows.tolist()
+		if rows[0]==0:
+			freq_sum[0] = [x * runs for x in values]
+
+		if trace is not None:
+			# view of the value vector, copied into the memo at each step
+			current = np.frombuffer(values, dtype=np.dtype(values.typecode))
+			dtype = trace_dtype(self.__state.max_state)
+		# value vector at the end of each run
+		end_values = list()
+		update = schemes[simtype] if profile is None else (lambda: schemes[simtype](profile))
+		if steady_state:
+			state = self.__state
+			current = np.frombuffer(values, dtype=np.dtype(values.typecode))
+			# values of the steps of the runs that were not simulated,
+			# added to freq_sum at the end
+			filled = np.zeros((len(steps), len(values)), dtype=np.int64)
+			# number of steps without a value change before checking
+			# whether the state is absorbing, doubled after each failed check
+			min_patience = max(len(self.__updateList), 1) if simtype=='ra' else 1
+
+		# Perform 'runs' number of simulation runs
+		for run in range(runs):
+			# Set elements to initial values and clear the delay counters
+			self.reset()
+
+			# 'memo' will store the value vector for each recorded step
+			# in this run (memory)
+			if trace is not None:
+				memo = np.empty((len(steps), len(values)), dtype=dtype)
+				if rows[0]==0:
+					memo[0] = current
+
+			# Perform 'simStep' number of simulation steps
+			if steady_state:
+				unchanged = 0
+				patience = min_patience
+				# states (values and delay counters) at each step, and the step
+				# at which each state was seen, to find the cycles of the sync scheme
+				history = [state.values.tobytes()+state.curr_delay_act.tobytes()+state.curr_delay_inh.tobytes()]
+				seen = {history[0]: 0}
+			for step in range(1,simStep+1):
+				# Update elements according to the simulation scheme
+				changed = update()
+
+				row = rows[step]
+				if row >= 0:
+					# increment the sum of values across runs
+					freq_sum[row] = list(map(add, freq_sum[row], values))
+					# store values for this step
+					if trace is not None:
+						memo[row] = current
+
+				if steady_state:
+					unchanged = 0 if changed else unchanged+1
+					if unchanged >= patience:
+						if self.is_absorbing():
+							rest = np.searchsorted(steps, step, side='right')
+							filled[rest:] += current
+							if trace is not None:
+								memo[rest:] = current
+							break
+						unchanged = 0
+						patience *= 2
+					if simtype=='sync':
+						key = state.values.tobytes()+state.curr_delay_act.tobytes()+state.curr_delay_inh.tobytes()
+						if key in seen:
+							self.follow_cycle(history, seen[key], step, steps, filled,
+								memo if trace is not None else None)
+							break
+						seen[key] = step
+						history.append(key)
+
+			if trace is not None:
+				trace(run, memo)
+			if stats is not None:
+				end_values.append(values.tolist())
+
+		if stats is not None and runs:
+			stats.add(np.array(end_values))
+		if steady_state:
+			freq_sum = (np.array(freq_sum, dtype=np.int64) + filled).tolist()
+		return freq_sum
+
+	def follow_cycle(self, history, first, step, steps, filled, memo):
+		""" Fill the remaining steps of a run with the sync scheme, which repeats the
+			states since step 'first', and set the state of its last step
+			Inputs:
+				history : states (values and delay counters, as bytes) at each step
+				first : step at which the state of this step was first seen
+				steps : recorded steps
+				filled : array of values added to freq_sum
+				memo : memo of the run, or None
+		"""
+
+		state = self.__state
+		n = len(state.values)
+		states = np.frombuffer(b''.join(history), dtype=np.dtype(state.values.typecode)).reshape(-1, 3*n)
+		rest = np.searchsorted(steps, step, side='right')
+		cycle = first + (steps[rest:] - first) % (step - first)
+		filled[rest:] += states[cycle, :n]
+		if memo is not None:
+			memo[rest:] = states[cycle, :n]
+		if len(cycle):
+			last = states[cycle[-1]].tolist()
+			state.values[:] = array(state.values.typecode, last[:n])
+			state.curr_delay_act[:] = array(state.values.typecode, last[n:2*n])
+			state.curr_delay_inh[:] = array(state.values.typecode, last[2*n:])
+
+	def is_absorbing(self):
+		""" returns True if no update can change the current values or delay counters """
+		for ele in self.__updateList:
+			if not ele.is_stable():
+				return False
+		return True
+
+	def simulate_adaptive(self, max_runs, simStep, **kwargs):
+		""" Simulate in batches of runs until the score of the end values is known
+			within the tolerance, or max_runs runs were performed (see simulate).
+			The runs are the same as the first runs of a simulation of max_runs runs.
+		"""
+
+		tolerance = kwargs["tolerance"]
+		min_runs = kwargs["min_runs"] if "min_runs" in kwargs else 10
+		batch = kwargs["batch"] if "batch" in kwargs else min_runs
+		confidence = kwargs["confidence"] if "confidence" in kwargs else 0.95
+		trace = kwargs["trace"] if "trace" in kwargs else None
+		steps = recorded_steps(simStep, kwargs["record"] if "record" in kwargs else 'all')
+
+		# values at the start of the simulation, for the first step of freq_sum
+		start = self.__state.values.tolist()
+		stats = RunningStats(len(start))
+		z = NormalDist().inv_cdf((1+confidence)/2)
+
+		# the worker processes sharing the runs of each batch are started once,
+		# each keeping a copy of the model (see simulate_parallel)
+		workers = kwargs["workers"] if "workers" in kwargs else 1
+		executor = ProcessPoolExecutor(max_workers=workers, initializer=start_shard_worker,
+			initargs=(self,)) if workers > 1 else None
+
+		freq_sum = None
+		done = 0
+		try:
+			while done < max_runs:
+				runs = min(max(batch, 1), max_runs-done)
+				shifted = (lambda run, memo, first=done: trace(first+run, memo)) if trace is not None else None
+				batch_sum = self.simulate(runs, simStep, **dict(kwargs, trace=shifted, stats=stats,
+					tolerance=None, executor=executor))
+				freq_sum = batch_sum if freq_sum is None else \
+					[list(map(add, x, y)) for x, y in zip(freq_sum, batch_sum)]
+				done += runs
+				if done >= min_runs and stats.score_half_width(z) <= tolerance:
+					break
+		finally:
+			if executor is not None:
+				executor.shutdown()
+
+		# the end values are also added to the stats of the caller
+		if "stats" in kwargs and kwargs["stats"] is not None:
+			kwargs["stats"].merge(stats)
+
+		if freq_sum is None:
+			freq_sum = [len(start)*[0] for step in steps]
+		if steps[0]==0:
+			freq_sum[0] = [x*done for x in start]
+		self.__runs_used = done
+		return freq_sum
+
+	def simulate_parallel(self, runs, simStep, **kwargs):
+		""" Share the runs of a simulation between worker processes (see simulate).
+			Each worker simulates a contiguous shard of runs with its own random stream,
+			derived from one seed drawn from the random stream of the model so that
+			seeding it (or the random module) makes the simulation reproducible.
+			Results are merged in run order.
+			An executor whose workers were started with start_shard_worker on this model
+			can be given as executor, to share the runs of several simulations
+			without starting processes and copying the model each time.
+		"""
+
+		workers = kwargs["workers"]
+		executor = kwargs["executor"] if "executor" in kwargs else None
+		trace = kwargs["trace"] if "trace" in kwargs else None
+		stats = kwargs["stats"] if "stats" in kwargs else None
+		# options of the simulation of each shard
+		options = {key: kwargs[key] for key in ('engine', 'steady_state', 'simtype', 'record') if key in kwargs}
+		profile = kwargs["profile"] if "profile" in kwargs else None
+
+		shards = [len(x) for x in np.array_split(np.arange(runs), min(workers, runs))]
+		seeds = np.random.SeedSequence(self.__rng.getrandbits(64)).spawn(len(shards))
+
+		freq_sum = None
+		first_run = 0
+		# the workers of a given executor hold their own copy of the model,
+		# brought to the current values
+		model = self if executor is None else None
+		values = None if executor is None else self.__state.values.tolist()
+		with ProcessPoolExecutor(max_workers=len(shards)) if executor is None else nullcontext(executor) as executor:
+			futures = [executor.submit(simulate_shard, model, shard_runs, simStep,
+				dict(options, profile=self.new_profile()) if profile is not None else options,
+				trace is not None, int(seed.generate_state(1, np.uint64)[0]), values)
+				for shard_runs, seed in zip(shards, seeds)]
+			for shard_runs, future in zip(shards, futures):
+				shard_freq_sum, memos, end_values, shard_stats, shard_profile = future.result()
+				if stats is not None:
+					stats.merge(shard_stats)
+				if profile is not None:
+					profile.merge(shard_profile)
+				freq_sum = shard_freq_sum if freq_sum is None else \
+					[list(map(add, x, y)) for x, y in zip(freq_sum, shard_freq_sum)]
+				if trace is not None:
+					for run, memo in enumerate(memos):
+						trace(first_run + run, memo)
+				first_run += shard_runs
+
+		# keep the values at the end of the last run, as in a serial simulation
+		self.__state.values[:] = array('l', end_values)
+		return freq_sum
+
+	def new_profile(self):
+		""" returns an empty ElementProfile of the elements of this model, see simulate """
+		names = sorted(self.__getElement)
+		complexity = [rule_complexity(self.__getElement[name].parse_rules()) for name in names]
+		return ElementProfile(names, [self.__state.index[name] for name in names], complexity)
+
+	def get_frequencies(self, freq_sum):
+		""" returns a dictionary mapping each element name to its sum of values
+			across runs at each recorded step (as in the Frequency Summary)
+			Inputs:
+				freq_sum : list of the summed value vector at each step, from simulate
+		"""
+
+		index = self.__state.index
+		return {name: [row[index[name]] for row in freq_sum] for name in sorted(self.__getElement)}
+
+	def get_end_values(self, freq_sum, runs, time_average=False):
+		""" returns a dictionary mapping each element name to its value at the last step,
+			averaged over runs
+			Inputs:
+				freq_sum : list of the summed value vector at each step, from simulate
+				runs : number of simulation runs
+				time_average : average the values over all the recorded steps instead,
+					e.g. the last steps recorded with record=('last', W)
+		"""
+
+		index = self.__state.index
+		end_sum = np.mean(freq_sum, axis=0).tolist() if time_average else freq_sum[-1]
+		return {name: end_sum[index[name]]/runs for name in sorted(self.__getElement)}
+
+	def write_run(self, output_file, memo, names, positions):
+		""" Write the values of each element at each step of one run to the output file
+			Inputs:
+				memo : (steps x value vector) array of values
+				names : element names, in output order
+				positions : positions of these elements in the value vector
+		"""
+
+		for name, pos in zip(names, positions):
+			output_file.write(name+' '+' '.join(map(str, memo[:, pos].tolist()))+'\n')
+
+	def write_frequency_summary(self, output_file, freq_sum, names, positions, steps=None):
+		""" Write the sum of values across runs (frequency) to the output file
+			Inputs:
+				freq_sum : list of the summed value vector at each step
+				names : element names, in output order
+				positions : positions of these elements in the value vector
+				steps : recorded steps, listed after the header unless all steps are recorded
+		"""
+
+		output_file.write('\nFrequency Summary:\n')
+		if steps is not None:
+			output_file.write('Recorded steps: '+' '.join(map(str, steps))+'\n')
+		for name, pos in zip(names, positions):
+			# also write max states for each element to output file
+			output_file.write(name+'|'+str(self.__state.max_state[pos])+'|'
+				+' '+' '.join([str(row[pos]) for row in freq_sum])+'\n')
+
+
+	def run_simulation_checker(self,simtype,simStep,outName):
+
+		output_file = open(outName,'w')
+		output_file.write('# time ')
+		for key in sorted(self.__getElement):
+			output_file.write(key+'_0 '+key+'_1 ')
+		output_file.write('step\n')
+
+		self.print_value(output_file,0)
+		for step in range(1,simStep+1):
+			self.ra_update()
+			self.print_value(output_file,step)
+
+		output_file.close()
+
+
+	def sync_update(self, profile=None):
+		""" Update all elements at once from the current values,
+			using the synchronous (sync) scheme, returns True if a value changed
+			Inputs:
+				profile : ElementProfile to which the updates are added, or None
+		"""
+
+		values = self.__state.values
+		previous = array(values.typecode, values)
+		changed = False
+		for ele in self.__updateList:
+			i = ele.get_index()
+			if profile is None:
+				values[i] = ele.next_compiled(previous)
+			else:
+				start = perf_counter()
+				values[i] = ele.next_compiled(previous)
+				profile.add(i, values[i]!=previous[i], perf_counter()-start)
+			changed = changed or values[i]!=previous[i]
+		return changed
+
+	def round_update(self, profile=None):
+		""" Update each element once, in a random order (round-based scheme),
+			returns True if a value changed
+			Inputs:
+				profile : ElementProfile to which the updates are added, or None
+		"""
+
+		changed = False
+		for ele in self.__rng.sample(self.__updateList, len(self.__updateList)):
+			changed = (ele.update_compiled() if profile is None else profile.update(ele)) or changed
+		return changed
+
+	def ra_update(self, profile=None):
+		""" Update all elements, using the random asynchronous (ra) scheme,
+			returns True if the value of the updated element changed
+			Inputs:
+				profile : ElementProfile to which the update is added, or None
+		"""
+
+		update_ele = self.__rng.choice(self.__updateList)
+		if profile is None:
+			return update_ele.update_compiled()
+		return profile.update(update_ele)
+
+	def print_value(self,output_file,step):
+
+		output_file.write(str(step)+'  ')
+		for key in sorted(self.__getElement):
+			val = self.__getElement[key].get_value()
+			output_file.write(str(val&1)+' ')
+			output_file.write(str((val&2)>>1)+' ')
+		output_file.write(str(step)+'\n')
+
+
+# model of a worker process started with start_shard_worker
+shard_worker = dict()
+
+def start_shard_worker(model):
+	""" Keep a copy of the model in a worker process, for the shards of simulate_parallel """
+	shard_worker['model'] = model
+
+def simulate_shard(model, runs, simStep, options, keep_trace, seed, values=None):
+	""" Simulate a shard of runs in a worker process (see Manager.simulate_parallel),
+		on the model of the worker (see start_shard_worker) if model is None,
+		from the given current values if any
+		Returns
+			freq_sum : list of the sum of the value vector across the runs of the shard at each step
+			memos : list of the memo of each run, empty if keep_trace is False
+			values : value vector at the end of the last run
+			stats : RunningStats of the value vectors at the end of the runs
+			profile : the ElementProfile of the options, or None
+	"""
+
+	if model is None:
+		model = shard_worker['model']
+	if values is not None:
+		model.set_values(values)
+	model.seed(seed)
+	memos = list()
+	stats = RunningStats(len(model.get_values()))
+	freq_sum = model.simulate(runs, simStep, **dict(options, stats=stats,
+		trace=(lambda run, memo: memos.append(memo)) if keep_trace else None))
+	return freq_sum, memos, model.get_values(), stats, options.get('profile')
+
+
+def recorded_steps(simStep, record='all'):
+	""" returns the sorted array of the steps recorded by a recording policy,
+		which always include the last step
+		Inputs:
+			simStep : number of simulation steps
+			record : 'all' for every step from 0 (the initial values) to simStep,
+				'end' for the last step only, ('every', k) for every k-th step,
+				or ('last', W) for the last W steps
+	"""
+
+	if record=='all':
+		return np.arange(simStep+1)
+	elif record=='end':
+		return np.array([simStep])
+	elif isinstance(record, (tuple, list)) and len(record)==2 and record[0]=='every' and record[1] >= 1:
+		return np.union1d(np.arange(0, simStep+1, record[1]), [simStep])
+	elif isinstance(record, (tuple, list)) and len(record)==2 and record[0]=='last' and record[1] >= 1:
+		return np.arange(max(simStep-record[1]+1, 0), simStep+1)
+	raise ValueError('Unknown recording policy: '+str(record))
+
+
+####################################################################
+class ElementProfile(object):
+	""" Define per-element counters of the updates of a simulation, to find the
+		elements that make it slow: how often each element was updated,
+		how often its value changed, the time spent updating it (evaluating
+		its compiled rules), and the complexity of its rules
+	"""
+
+	# columns of the table, see get_table
+	COLUMNS = ('element', 'updates', 'changes', 'time_s', 'time_per_update_us', 'regulators', 'depth')
+
+	def __init__(self, names, positions, complexity):
+		""" Inputs:
+				names : element names, in table order
+				positions : positions of these elements in the value vector
+				complexity : (regulators, nesting depth) of the rules of each element
+		"""
+		self.names = list(names)
+		self.positions = list(positions)
+		self.complexity = list(complexity)
+		size = max(self.positions + [-1]) + 1
+		# counters indexed by position in the value vector
+		self.updates = size*[0]
+		self.changes = size*[0]
+		self.time = size*[0.0]
+
+	def add(self, i, changed, seconds):
+		""" Count an update of the element at position i """
+		self.updates[i] += 1
+		self.changes[i] += changed
+		self.time[i] += seconds
+
+	def update(self, ele):
+		""" Update an element with its compiled rules, counting and timing the update,
+			returns True if its value changed
+		"""
+		start = perf_counter()
+		changed = ele.update_compiled()
+		self.add(ele.get_index(), changed, perf_counter()-start)
+		return changed
+
+	def merge(self, other):
+		""" Add the counters of another profile of the same model """
+		self.updates = list(map(add, self.updates, other.updates))
+		self.changes = list(map(add, self.changes, other.changes))
+		self.time = list(map(add, self.time, other.time))
+
+	def get_table(self):
+		""" returns the list of rows of the table, one per element, in the order of COLUMNS """
+		table = list()
+		for name, i, (regulators, depth) in zip(self.names, self.positions, self.complexity):
+			per_update = 1e6*self.time[i]/self.updates[i] if self.updates[i] else 0.0
+			table.append([name, self.updates[i], self.changes[i], self.time[i], per_update, regulators, depth])
+		return table
+
+	def write_table(self, filename):
+		""" Write the table to a CSV file, with a header row of the column names """
+		with open(filename, 'w', newline='') as f:
+			writer = csv.writer(f)
+			writer.writerow(self.COLUMNS)
+			writer.writerows(self.get_table())
+
+
+####################################################################
+class RunningStats(object):
+	""" Define streaming accumulators of the mean and variance of each element's
+		value at the end of the runs of a simulation (Welford's algorithm,
+		combining batches of runs with Chan's formula)
+	"""
+	__slots__ = ('count','mean','m2')
+
+	def __init__(self, size):
+		self.count = 0
+		self.mean = np.zeros(size)
+		# sum of squared differences from the mean
+		self.m2 = np.zeros(size)
+
+	def add(self, end_values):
+		""" Add a (runs x value vector) array of end values """
+		end_values = np.asarray(end_values, dtype=float)
+		if len(end_values):
+			self.combine(len(end_values), end_values.mean(axis=0),
+				((end_values - end_values.mean(axis=0))**2).sum(axis=0))
+
+	def merge(self, other):
+		""" Add the runs of another RunningStats """
+		if other.count:
+			self.combine(other.count, other.mean, other.m2)
+
+	def combine(self, count, mean, m2):
+		total = self.count + count
+		delta = mean - self.mean
+		self.mean = self.mean + delta * count / total
+		self.m2 = self.m2 + m2 + delta**2 * self.count * count / total
+		self.count = total
+
+	def variance(self):
+		""" returns the sample variance of each element's end value """
+		if self.count < 2:
+			return np.full(len(self.mean), np.inf)
+		return self.m2 / (self.count - 1)
+
+	def score_half_width(self, z):
+		""" returns the half-width of the confidence interval of the score
+			sum(|expected - mean|) of the mean end values, for any expected values.
+			To first order the error of the score is a signed sum of the errors
+			of the means; taking these as independent, its variance is the sum
+			of the variances of the means, whatever the signs.
+		"""
+		if self.count < 2:
+			return np.inf
+		return float(z * np.sqrt(self.variance().sum() / self.count))
+
+
+####################################################################
+class ModelState(object):
+	""" Define an integer-indexed store of the values, max states, and delays
+		of the elements in a model, kept in flat arrays
+	"""
+	__slots__ = ('names','index','values','initial','max_state',
+		'delay_act','delay_inh','curr_delay_act','curr_delay_inh')
+
+	def __init__(self):
+		# element names by position, and positions by element name
+		self.names = list()
+		self.index = dict()
+		# current and initial element values
+		self.values = array('l')
+		self.initial = array('l')
+		# number of discrete levels (states) for each element
+		self.max_state = array('l')
+		# delay values for spontaneous activation and inhibition
+		self.delay_act = array('l')
+		self.delay_inh = array('l')
+		# current delay values for spontaneous activation and inhibition
+		self.curr_delay_act = array('l')
+		self.curr_delay_inh = array('l')
+
+	def add(self,name,val,max_state,delay_act,delay_inh):
+		""" Intern an element name to the next position in the store
+			and return that position
+		"""
+		pos = len(self.names)
+		self.names.append(name)
+		self.index[name] = pos
+		self.values.append(int(val))
+		self.initial.append(int(val))
+		self.max_state.append(int(max_state))
+		self.delay_act.append(int(delay_act))
+		self.delay_inh.append(int(delay_inh))
+		self.curr_delay_act.append(0)
+		self.curr_delay_inh.append(0)
+		return pos
+
+	def truncate(self,size):
+		""" Remove the elements at positions size and after """
+		for name in self.names[size:]:
+			del self.index[name]
+		del self.names[size:]
+		for values in (self.values, self.initial, self.max_state, self.delay_act,
+			self.delay_inh, self.curr_delay_act, self.curr_delay_inh):
+			del values[size:]
+
+
+####################################################################
+class gateNode(object):
+	""" Define a node object containing an element, regulators, and states
+	"""
+	__slots__ = ('__regulated','__act','__inh','__name_list','__name_to_value',
+		'__state','__index','__act_pos','__inh_pos','__act_fn','__inh_fn')
+
+	# TODO: create constants for default values
+	def __init__(self,X,A,I,curr_val,max_state=3,delay_act=3,delay_inh=3,state=None):
+		# the regulated (current) element
+		self.__regulated = X.strip()
+		# activator of the current element
+		self.__act = re.sub('\s','',A)
+		# inhibitor of the current element
+		self.__inh = re.sub('\s','',I)
+		# list of the element and its regulators,
+		# and dictionary mapping element names to their values,
+		# only created when the rule strings are evaluated by update()
+		self.__name_list = None
+		self.__name_to_value = None
+		# the current value, number of discrete levels (states), and
+		# spontaneous activation/inhibition delays of this element are stored
+		# in the state store of the model, at position __index
+		self.__state = ModelState() if state is None else state
+		self.__index = self.__state.add(X.strip(),curr_val,max_state,delay_act,delay_inh)
+		# compiled activation/inhibition rules, defined by compile():
+		# positions of the regulators when the rule is a plain list of regulators,
+		# otherwise a function of the value vector
+		self.__act_pos = None
+		self.__inh_pos = None
+		self.__act_fn = None
+		self.__inh_fn = None
+
+	def __getstate__(self):
+		""" Pickle this node without its compiled rules,
+			the model (Manager) compiles them again when it is unpickled
+		"""
+		return (self.__regulated, self.__act, self.__inh, self.__state, self.__index)
+
+	def __setstate__(self, state):
+		self.__regulated, self.__act, self.__inh, self.__state, self.__index = state
+		self.__name_list = None
+		self.__name_to_value = None
+		self.__act_pos = None
+		self.__inh_pos = None
+		self.__act_fn = None
+		self.__inh_fn = None
+
+	##### Get functions #####
+
+	def get_name(self):
+		return self.__regulated
+
+	def get_max_state(self):
+		return self.__state.max_state[self.__index]
+
+	def get_name_list(self):
+		if self.__name_list is None:
+			self.__name_list = self.create_name_list(self.__regulated,self.__act,self.__inh)
+		return self.__name_list
+
+	def get_value(self):
+		return self.__state.values[self.__index]
+
+	def get_index(self):
+		return self.__index
+
+	def get_rules(self):
+		return self.__act, self.__inh
+
+	#########################
+
+	def set_rules(self,A,I):
+		""" Replace the activation and inhibition rules of this element,
+			compile() must be called again before update_compiled()
+		"""
+		self.__act = re.sub('\s','',A)
+		self.__inh = re.sub('\s','',I)
+		self.__name_list = None
+		self.__name_to_value = None
+		self.__act_pos = None
+		self.__inh_pos = None
+		self.__act_fn = None
+		self.__inh_fn = None
+
+	def set_value(self,val):
+		""" Set this element's current value """
+		self.__state.values[self.__index] = val
+
+	def create_name_list(self,X,A,I):
+		""" Create a list of this element, activator, and inhibitor names """
+		names = set([X])
+		act_set = set(re.findall(r'[\.\w_@\*\#/;]+',A))
+		inh_set = set(re.findall(r'[\.\w_@\*\#/;]+',I))
+		# TODO: subtracting names?
+		return sorted(list(act_set-names)) + sorted(list(inh_set-act_set-names)) + list(names)
+
+	def parse_rules(self):
+		""" returns the lists of terms of the activation and inhibition rules
+			(see parse_rule), using the positions of the state store
+		"""
+		index = self.__state.index
+		act_terms = parse_rule(self.__act,index,True) if self.__act else []
+		inh_terms = parse_rule(self.__inh,index,False) if self.__inh else []
+		return act_terms, inh_terms
+
+	def compile(self):
+		""" Parse the activation and inhibition rules once into functions
+			of the value vector of the state store
+		"""
+		N = self.get_max_state()-1
+		act_terms, inh_terms = self.parse_rules()
+		self.__act_pos, self.__act_fn = compile_rule(act_terms,N) if act_terms else (None, None)
+		self.__inh_pos, self.__inh_fn = compile_rule(inh_terms,N) if inh_terms else (None, None)
+
+	def update(self,getElement):
+		""" Update this element by evaluating the rule strings (reference evaluator) """
+		self.__name_to_value = dict()
+		for name in self.get_name_list():
+			self.__name_to_value[name] = getElement[name].get_value()
+		self.set_value(self.evaluate())
+
+	def update_compiled(self):
+		""" Update this element using the compiled rules,
+			must be called after compile(); returns True if the value changed
+		"""
+		values = self.__state.values
+		X_curr = values[self.__index]
+		X_next = values[self.__index] = self.next_compiled(values)
+		return X_next != X_curr
+
+	def next_compiled(self,values):
+		""" returns the next value of this element given a value vector,
+			using the compiled rules (updates the delay counters)
+		"""
+		if self.__act_pos:
+			y_act = max([values[i] for i in self.__act_pos])
+		elif self.__act_fn:
+			y_act = self.__act_fn(values)
+		else:
+			y_act = None
+		if self.__inh_pos:
+			y_inh = max([values[i] for i in self.__inh_pos])
+		elif self.__inh_fn:
+			y_inh = self.__inh_fn(values)
+		else:
+			y_inh = None
+		return self.next_value(y_act,y_inh,values[self.__index])
+
+	def is_stable(self):
+		""" returns True if an update would change neither the value
+			nor the delay counters of this element
+		"""
+		state = self.__state
+		i = self.__index
+		X_curr = state.values[i]
+		delays = (state.curr_delay_act[i], state.curr_delay_inh[i])
+		changed = self.update_compiled()
+		stable = not changed and delays==(state.curr_delay_act[i], state.curr_delay_inh[i])
+		# restore the state
+		state.values[i] = X_curr
+		state.curr_delay_act[i], state.curr_delay_inh[i] = delays
+		return stable
+
+	def evaluate(self):
+		""" determine the value of the regulated element
+			based on values of the inhibitors and activators
+		"""
+
+		# calculate activation and inhibition scores
+		y_act = self.eval_act(self.__act,0)
+		y_inh = self.eval_inh(self.__inh,0)
+
+		return self.next_value(y_act,y_inh,int(self.__name_to_value[self.__regulated]))
+
+	def next_value(self,y_act,y_inh,X_curr):
+		""" determine the next value of the regulated element
+			from the activation and inhibition scores and its current value X_curr
+		"""
+
+		# define max states and max delays for code readability
+		state = self.__state
+		i = self.__index
+		N = state.max_state[i]-1
+		D_act = state.delay_act[i]
+		D_inh = state.delay_inh[i]
+
+		# determine next value of the regulated element,
+		# based on the type of regulators and activation/inhibition scores
+		if (self.__act) and (not self.__inh):
+			# this element has only positive regulators
+			# set the next value to increase if activation > 0,
+			# but don't increase beyond the maximum state.
+			# if there is no activation, the value should spontaneously decay,
+			# but not below 0
+			if (y_act > 0) and (X_curr < N):
+				X_next = X_curr + 1
+			elif (y_act > 0) and (X_curr == N):
+				X_next = X_curr
+			elif (y_act == 0) and (X_curr > 0):
+				# spontaneously decay (inhibition)
+				if state.curr_delay_inh[i] < D_inh:
+					# hold current value and increment delay
+					X_next = X_curr
+					state.curr_delay_inh[i] += 1
+				else:
+					# decay and reset delay
+					X_next = X_curr - 1
+					state.curr_delay_inh[i] = 0
+			elif (y_act == 0) and (X_curr == 0):
+				X_next = X_curr
+		elif (not self.__act) and (self.__inh):
+			# this element has only negative regulators
+			# set the next value to decrease if inhibition > 0,
+			# but don't decrease below 0.
+			# if there is no inhibition, the value should spontaneously increase,
+			# but not beyond the maximum state.
+			if (y_inh > 0) and (X_curr > 0):
+				X_next = X_curr - 1
+			elif (y_inh > 0) and (X_curr == 0):
+				X_next = X_curr
+			elif (y_inh == 0) and (X_curr < N):
+				# spontaneously increase
+				if state.curr_delay_act[i] < D_act:
+					# hold current value and increment delay
+					X_next = X_curr
+					state.curr_delay_act[i] += 1
+				else:
+					# increase and reset delay
+					X_next = X_curr + 1
+					state.curr_delay_act[i] = 0
+			elif (y_inh == 0) and (X_curr == N):
+				X_next = X_curr
+		elif (self.__act) and (self.__inh):
+			# this element has both activators and inhibitors
+			# increase the value if activation > inhibition,
+			# decrease if activation <= inhibition,
+			# but not above/below the bounds of the max/min states.
+			# Note: this means if activation == inhibition,
+			# the value spontaneously decays.
+			if 	(y_act > y_inh) and (X_curr < N):
+				X_next = X_curr + 1
+			elif (y_act > y_inh) and (X_curr == N):
+				X_next = X_curr
+			elif (y_act <= y_inh) and (X_curr > 0):
+				# spontaneously decay (inhibition)
+				if state.curr_delay_inh[i] < D_inh:
+					# hold current value and increment delay
+					X_next = X_curr
+					state.curr_delay_inh[i] += 1
+				else:
+					# decay and reset delay
+					X_next = X_curr - 1
+					state.curr_delay_inh[i] = 0
+			elif (y_act <= y_inh) and (X_curr == 0):
+				X_next = X_curr
+
+		elif (not self.__act) and (not self.__inh):
+			# this element has no regulators; hold its value
+			X_next = X_curr
+
+		# return the next state,
+		# with a redundant sort to keep X_next within the state value bounds
+		return sorted([0, X_next , N])[1]
+
+	def eval_inh(self,inh_rule,layer):
+		""" returns an int y_sum indicating the inhibition score
+			calculated based on the value of the inhibitors
+			Inputs:
+				inh_rule : inhibitor function notation
+				layer : set != 0 when the function is called recursively
+		"""
+
+		# Only calculate the score if there are actually inhibitors for this element
+		if inh_rule:
+			# create a list of inhibitors from influence set notation
+			# inhibitors are separated by commas (outside parentheses)
+			inh_list = self.split_comma_outside_parentheses(inh_rule)
+			y_sum = list()
+
+			# parse inhibitors, first checking for groups of elements in ()
+			for inh_element in inh_list:
+				if inh_element[0]=='(' and inh_element[-1]==')':
+					# this is and AND operation, all inhibitors must be present
+					# construct a list of the values of each element, then perform discrete AND (min)
+					y_and = [int(x) \
+						for and_entity in self.split_comma_outside_parentheses(inh_element[1:-1]) \
+						for x in self.eval_inh(and_entity,1)]
+					y_sum += [min(y_and)]
+				else:
+					# single inhibitor
+					# confirm there are no commas separating inhibitors
+					assert(inh_element.find(',')==-1)
+					# TODO: add code below for highest state inhibitors?
+					if inh_element[-1]=='+':
+					# highest state inhibitor
+					# increment the sum, calculating the increment value by comparing to the max state
+						if inh_element[0]=='!':
+							y_sum += int(not self.__name_to_value[inh_element[1:-1]]==self.get_max_state()-1)
+						else:
+							y_sum += int(self.__name_to_value[inh_element[:-1]]==self.get_max_state()-1)*2
+					elif inh_element[0]=='!':
+						y_sum += [int(self.discrete_not(self.__name_to_value[inh_element[1:]],self.get_max_state()-1))]
+					else:
+
+					# calculate the value of the sum based on the value of the inhibitor
+					# using the state name to value mapping (__name_to_value dictionary)
+						y_sum += [int(self.__name_to_value[inh_element])]
+
+			if layer==0:
+				# TODO: initializer values for inhibitors?
+				return max(y_sum)
+			else:
+				return y_sum
+
+	def eval_act(self,act_rule,layer):
+		""" returns a string list y_sum indicating the activation score,
+			calculated based on the value of the activators
+			Inputs:
+				act_rule : activator function notation
+				layer : set != 0 when the function is called recursively
+		"""
+
+		# Only calculate the score if there are actually activators for this element
+		if act_rule:
+			# TODO: define N = self.get_max_state()-1 to make more readable
+
+			# create a list of activators from influence set notation
+			# activators are separated by commas (outside parentheses)
+			act_list = self.split_comma_outside_parentheses(act_rule)
+
+			y_init = list()
+			y_sufficient = list()
+			# TODO: explain why score is initialized as a list
+			y_sum = list()
+			y_must = list()
+			y_enhance = list()
+			# parse activators, first checking for elements in {},  ()
+			for act_element in act_list:
+				if act_element[0]=='{' and act_element[-1]=='}':
+					# this is an initializer
+					# confirm that this is layer 0
+					assert(layer==0)
+					# define as an initializer, evaluating only the expression within the brackets
+					y_sum += self.eval_act(act_element[1:-1],1)
+				elif act_element[0]=='{' and act_element[-1]==']':
+					# this is a necessary pair
+					# Find the cut point between {} and []
+					parentheses = 0
+					cut_point = 0
+					for index in range(len(act_element)):
+						if act_element[index]=='{':
+							parentheses += 1
+						elif act_element[index]=='}':
+							parentheses -= 1
+						if parentheses==0:
+							cut_point = index
+							break
+					# define the first part as the sufficient element
+					y_must += self.eval_act(act_element[1:cut_point],1)
+					# define the second part as the enhancing/strengthening element
+					y_enhance += self.eval_act(act_element[cut_point+2:-1],1)
+					# increment the score according to the values of both the sufficient and enhancing elements
+					# but use the 'sorted' expression to keep the value below the max state value
+					# TODO: check min(min(y_must),max(y_enhance))
+					y_sum += [0 if all([y==0 for y in y_must])==True \
+						else sorted([0, int(max(min(y_must),max(y_enhance))), self.get_max_state()-1])[1]]
+				elif act_element[0]=='(' and act_element[-1]==')':
+					# this is an AND operation, all activators must be present
+					# construct a list of the values of each element, then perform discrete AND (min)
+					y_and = [int(x) \
+						for and_entity in self.split_comma_outside_parentheses(act_element[1:-1]) \
+						for x in self.eval_act(and_entity,1)]
+					y_sum += [min(y_and)]
+				else:
+					# single activator
+					# confirm that there are no commas separating activators
+					assert(act_element.find(',')==-1)
+					# calculate the value of the score based on the value of the activator
+					# using the state name to value mapping (__name_to_value dictionary)
+					if act_element[-1]=='+':
+						# this is a highest state activator
+						# increment the score only if this activator is at the max state
+						if act_element[0]=='!':
+							y_sum += [int(not self.__name_to_value[act_element[1:-1]]==self.get_max_state()-1)]
+						else:
+							# TODO: Why multiplying by 2? check Description.pptx for scoring info
+							y_sum += [int(self.__name_to_value[act_element[:-1]]==self.get_max_state()-1)*2]
+					elif act_element[0]=='!':
+						y_sum += [int(self.discrete_not(self.__name_to_value[act_element[1:]],self.get_max_state()-1))]
+					else:
+						y_sum += [int(self.__name_to_value[act_element])]
+
+			if layer==0:
+				# check for initializers and value of intializers
+				if (self.__name_to_value[self.__regulated]==0
+					and len(y_init)!=0
+					and all([y==0 for y in y_init])==True):
+					return 0
+				else:
+					return max(y_sum)
+
+			else:
+				return y_sum
+
+	def discrete_not(self, x, N):
+		"""
+		"""
+		if N >= x:
+			return (N - x)
+		else:
+			raise ValueError('Can''t compute NOT, input is greater than max state')
+
+	def split_comma_outside_parentheses(self, sentence):
+		return split_comma_outside_parentheses(sentence)
+
+	# TODO: add the function to generate a model expression (same as in utility_function.py)
+
+
+####################################################################
+# Rule compilation
+#
+# Activation and inhibition rules are parsed once into a list of terms
+# following the grammar of gateNode.eval_act and gateNode.eval_inh,
+# where each term is a tuple:
+#	('var', i)                  value of element i
+#	('not', i)                  discrete NOT of element i  (!A)
+#	('highest', i)              2 if element i is at its highest state, else 0  (A+)
+#	('not_highest', i)          1 if element i is not at its highest state, else 0  (!A+)
+#	('and', terms)              discrete AND (min) of the terms  ((A,B))
+#	('pair', musts, enhances)   necessary pair  ({A}[B])
+# and i is the position of the element in the model value vector.
+# The score of a rule is the max over its terms.
+
+def split_comma_outside_parentheses(sentence):
+	""" Split a rule at the commas that are not inside (), {} or [] """
+	final_list = list()
+	parentheses = 0
+	start = 0
+	for index in range(len(sentence)):
+		char = sentence[index]
+		if index==len(sentence)-1:
+			final_list.append(sentence[start:index+1])
+		elif char=='(' or char=='{' or char=='[':
+			parentheses += 1
+		elif char==')' or char=='}' or char==']':
+			parentheses -= 1
+		elif (char==',' and parentheses==0):
+			final_list.append(sentence[start:index])
+			start = index+1
+	return final_list
+
+def parse_rule(rule,index,activation,layer=0):
+	""" returns the list of terms of an activation or inhibition rule
+		Inputs:
+			rule : activator or inhibitor function notation (without whitespace)
+			index : dictionary mapping element names to their position in the value vector
+			activation : True for activation rules, which also accept
+				initializers {} and necessary pairs {}[]
+			layer : set != 0 when the function is called recursively
+	"""
+
+	terms = list()
+	# as in eval_act, the sufficient and enhancing elements accumulate
+	# over all necessary pairs of the same rule
+	musts = list()
+	enhances = list()
+	for element in split_comma_outside_parentheses(rule):
+		if activation and element[0]=='{' and element[-1]=='}':
+			# initializer, only allowed at layer 0
+			assert(layer==0)
+			terms += parse_rule(element[1:-1],index,activation,1)
+		elif activation and element[0]=='{' and element[-1]==']':
+			# necessary pair, find the cut point between {} and []
+			parentheses = 0
+			cut_point = 0
+			for char_index in range(len(element)):
+				if element[char_index]=='{':
+					parentheses += 1
+				elif element[char_index]=='}':
+					parentheses -= 1
+				if parentheses==0:
+					cut_point = char_index
+					break
+			musts += parse_rule(element[1:cut_point],index,activation,1)
+			enhances += parse_rule(element[cut_point+2:-1],index,activation,1)
+			terms.append(('pair',tuple(musts),tuple(enhances)))
+		elif element[0]=='(' and element[-1]==')':
+			# AND operation over all the terms of the group
+			terms.append(('and',tuple(term \
+				for and_entity in split_comma_outside_parentheses(element[1:-1]) \
+				for term in parse_rule(and_entity,index,activation,1))))
+		else:
+			# single regulator
+			assert(element.find(',')==-1)
+			if element[-1]=='+':
+				if element[0]=='!':
+					terms.append(('not_highest',index[element[1:-1]]))
+				else:
+					terms.append(('highest',index[element[:-1]]))
+			elif element[0]=='!':
+				terms.append(('not',index[element[1:]]))
+			else:
+				terms.append(('var',index[element]))
+	return terms
+
+def rule_complexity(rules):
+	""" returns the number of regulators (leaves) and the nesting depth
+		of the activation and inhibition rules parsed by parse_rules
+	"""
+
+	def measure(terms):
+		leaves = 0
+		depth = 0
+		for term in terms:
+			if term[0]=='and':
+				inner = measure(term[1])
+			elif term[0]=='pair':
+				inner = measure(term[1]+term[2])
+			else:
+				leaves += 1
+				depth = max(depth, 1)
+				continue
+			leaves += inner[0]
+			depth = max(depth, inner[1]+1)
+		return leaves, depth
+
+	act, inh = [measure(terms) for terms in rules]
+	return act[0]+inh[0], max(act[1], inh[1])
+
+def compile_rule(terms,N):
+	""" returns the compiled form of a rule as (positions, function):
+		the tuple of regulator positions if every term is a single regulator,
+		so the score is the max of their values, otherwise a function of the value vector
+	"""
+
+	if all(term[0]=='var' for term in terms):
+		return tuple(term[1] for term in terms), None
+	return None, compile_terms(terms,N)
+
+def compile_terms(terms,N):
+	""" returns a function of the value vector computing the max over the terms
+		Inputs:
+			terms : list of terms from parse_rule
+			N : highest state of the regulated element (max_state-1)
+	"""
+
+	if all(term[0]=='var' for term in terms):
+		positions = tuple(term[1] for term in terms)
+		if len(positions)==1:
+			return itemgetter(positions[0])
+		return lambda values: max([values[i] for i in positions])
+
+	functions = [compile_term(term,N) for term in terms]
+	if len(functions)==1:
+		return functions[0]
+	return lambda values: max([f(values) for f in functions])
+
+def compile_term(term,N):
+	""" returns a function of the value vector computing the score of one term """
+
+	op = term[0]
+	if op=='var':
+		return itemgetter(term[1])
+	elif op=='not':
+		i = term[1]
+		def discrete_not(values):
+			if N >= values[i]:
+				return N - values[i]
+			else:
+				raise ValueError('Can''t compute NOT, input is greater than max state')
+		return discrete_not
+	elif op=='highest':
+		i = term[1]
+		return lambda values: 2 if values[i]==N else 0
+	elif op=='not_highest':
+		i = term[1]
+		return lambda values: 0 if values[i]==N else 1
+	elif op=='and':
+		if all(t[0]=='var' for t in term[1]):
+			positions = tuple(t[1] for t in term[1])
+			return lambda values: min([values[i] for i in positions])
+		functions = [compile_term(t,N) for t in term[1]]
+		return lambda values: min([f(values) for f in functions])
+	elif op=='pair':
+		musts = [compile_term(t,N) for t in term[1]]
+		enhances = [compile_term(t,N) for t in term[2]]
+		def necessary_pair(values):
+			y_must = [f(values) for f in musts]
+			if all([y==0 for y in y_must]):
+				return 0
+			return sorted([0, max(min(y_must),max([f(values) for f in enhances])), N])[1]
+		return necessary_pair
+	else:
+		raise ValueError('Unknown rule term: '+str(op))
+
+# TODO: define a main function?
+# def main():
+
+# if __name__=="__main__":
+# 	main()
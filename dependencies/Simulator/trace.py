@@ -0,0 +1,167 @@
+import json
+import struct
+import numpy as np
+
+# Binary trace files start with MAGIC, followed by the length of a JSON header
+# (little-endian uint32), the header, and padding up to a multiple of ALIGNMENT bytes.
+# The header holds the element names, their max states, the kind of trace,
+# the number of simulation runs, the recorded steps (null if every step is recorded),
+# and the dtype and shape of the data that follows,
+# a C-ordered array of (runs x steps x elements) values for a 'trace',
+# or (1 x steps x elements) sums of values across runs for a 'frequency' trace
+# (floating point, as the exact engine gives expected sums).
+MAGIC = b'\x93FIDDLE-TRACE\x01'
+ALIGNMENT = 64
+
+
+def trace_dtype(max_states):
+	""" returns the smallest unsigned integer dtype holding values up to the highest state """
+	top = max([int(x) for x in max_states] + [1]) - 1
+	return np.dtype(np.min_scalar_type(top)).newbyteorder('<')
+
+def is_binary_trace(filename):
+	""" returns True if the file is a binary trace """
+	with open(filename, 'rb') as f:
+		return f.read(len(MAGIC)) == MAGIC
+
+
+class TraceWriter(object):
+	""" Define a binary trace file, written one run at a time through a memory map
+	"""
+
+	def __init__(self, filename, names, max_states, runs, steps, kind='trace', recorded=None):
+		""" Create the trace file
+			Inputs:
+				filename : name of the trace file
+				names : element names, in the order of the values of each step
+				max_states : max number of states of these elements
+				runs : number of simulation runs
+				steps : number of recorded steps in each run (simStep+1 if all are recorded)
+				kind : 'trace' for the values of each run,
+					or 'frequency' for the sum of values across runs
+				recorded : list of the recorded steps, None if every step is recorded
+		"""
+
+		dtype = trace_dtype(max_states) if kind=='trace' else np.dtype('<f8')
+		shape = (runs if kind=='trace' else 1, steps, len(names))
+		self.__filename = filename
+		self.__header = {
+			'kind': kind,
+			'names': list(names),
+			'max_states': [int(x) for x in max_states],
+			'runs': runs,
+			'steps': recorded,
+			'dtype': dtype.str,
+			'shape': shape}
+		header = json.dumps(self.__header).encode('utf-8')
+		self.__header_len = len(header)
+		self.__offset = len(MAGIC) + 4 + len(header)
+		self.__offset += -self.__offset % ALIGNMENT
+
+		with open(filename, 'wb') as f:
+			f.write(MAGIC + struct.pack('<I', len(header)) + header)
+			f.truncate(self.__offset + int(np.prod(shape)) * dtype.itemsize)
+
+		self.__data = np.memmap(filename, dtype=dtype, mode='r+', offset=self.__offset, shape=shape) \
+			if np.prod(shape) else np.zeros(shape, dtype=dtype)
+
+	def write_run(self, run, memo):
+		""" Write the (steps x elements) values of one run """
+		self.__data[run] = memo
+
+	def close(self, runs=None):
+		""" Flush the written values to the file
+			Inputs:
+				runs : number of runs written, if fewer than announced
+					(an adaptive simulation that converged early)
+		"""
+		if isinstance(self.__data, np.memmap):
+			self.__data.flush()
+		self.__data = None
+		if runs is None or runs==self.__header['runs']:
+			return
+
+		# keep only the written runs, rewriting the header in place
+		# (padded with spaces to its former length)
+		header = self.__header
+		header['runs'] = runs
+		if header['kind']=='trace':
+			header['shape'] = (runs,) + tuple(header['shape'][1:])
+		encoded = json.dumps(header).encode('utf-8').ljust(self.__header_len)
+		with open(self.__filename, 'r+b') as f:
+			f.seek(len(MAGIC) + 4)
+			f.write(encoded)
+			f.truncate(self.__offset + int(np.prod(header['shape'])) * np.dtype(header['dtype']).itemsize)
+
+
+class TraceReader(object):
+	""" Define a read-only view of a binary trace file, loading values lazily
+	"""
+
+	def __init__(self, filename):
+		""" Open the trace file
+			Inputs:
+				filename : name of the trace file
+		"""
+
+		with open(filename, 'rb') as f:
+			if f.read(len(MAGIC)) != MAGIC:
+				raise ValueError(filename+' is not a binary trace file')
+			header_len = struct.unpack('<I', f.read(4))[0]
+			header = json.loads(f.read(header_len).decode('utf-8'))
+		offset = len(MAGIC) + 4 + header_len
+		offset += -offset % ALIGNMENT
+
+		self.kind = header['kind']
+		self.names = header['names']
+		self.max_states = header['max_states']
+		self.runs = header['runs']
+		self.__index = {name: i for i, name in enumerate(self.names)}
+		shape = tuple(header['shape'])
+		# step of each row of values
+		self.steps = header['steps'] if header.get('steps') is not None else list(range(shape[1]))
+		self.__data = np.memmap(filename, dtype=np.dtype(header['dtype']), mode='r', offset=offset, shape=shape) \
+			if np.prod(shape) else np.zeros(shape, dtype=np.dtype(header['dtype']))
+
+	def get_values(self):
+		""" returns the (runs x steps x elements) array of values, memory-mapped """
+		self.check_kind()
+		return self.__data
+
+	def get_run(self, run):
+		""" returns the (steps x elements) values of one run """
+		self.check_kind()
+		return self.__data[run]
+
+	def get_element(self, name):
+		""" returns the (runs x steps) values of one element """
+		self.check_kind()
+		return self.__data[:, :, self.__index[name]]
+
+	def get_frequencies(self):
+		""" returns the (steps x elements) sum of values across runs,
+			reading one run at a time
+		"""
+		if self.kind=='frequency':
+			return np.array(self.__data[0])
+		freq_sum = np.zeros(self.__data.shape[1:], dtype=np.int64)
+		for run in range(self.__data.shape[0]):
+			freq_sum += self.__data[run]
+		return freq_sum
+
+	def get_end_values(self, runs=None, time_average=False):
+		""" returns a dictionary mapping each element name to its value
+			at the last step, averaged over runs (default: the runs of the trace),
+			or with time_average over all the recorded steps as well
+		"""
+		runs = self.runs if runs is None else runs
+		last = slice(None) if time_average else slice(-1, None)
+		if self.kind=='frequency':
+			end_sum = self.__data[0, last].mean(axis=0).tolist()
+		else:
+			end_sum = self.__data[:, last, :].sum(axis=0, dtype=np.int64).mean(axis=0).tolist()
+		return {name: end_sum[i]/runs for i, name in enumerate(self.names)}
+
+	def check_kind(self):
+		if self.kind!='trace':
+			raise ValueError('This trace file only holds the sum of values across runs')
@@ -0,0 +1,396 @@
+import random
+import numpy as np
+
+class VectorizedEngine(object):
+	""" Define a simulation engine that advances all runs of a model together,
+		holding the element values of every run in a (runs x elements) matrix.
+		Runs are independent: the delay counters of every run start at 0,
+		as in the other engines.
+		The regulators of all elements are held in padded (elements x terms x leaves)
+		position tables, so a synchronous step of the whole network is a few
+		array operations.
+	"""
+
+	def __init__(self, state, update_list):
+		""" Initialize the engine from a model
+			Inputs:
+				state : ModelState of the model (values, max states, delays)
+				update_list : list of gateNode objects of the elements with regulators
+		"""
+
+		n = len(state.names)
+		self.__n = n
+		self.__initial = np.array(state.initial, dtype=np.int64)
+		self.__values = np.array(state.values, dtype=np.int64)
+		# highest state (N) and delays of each element
+		self.__top = np.array(state.max_state, dtype=np.int64) - 1
+		self.__delay_act = np.array(state.delay_act, dtype=np.int64)
+		self.__delay_inh = np.array(state.delay_inh, dtype=np.int64)
+		# positions of the elements that can be picked for an update
+		self.__update = np.array([ele.get_index() for ele in update_list], dtype=np.int64)
+
+		# Rules are stored as (elements x terms x leaves) tables of regulator
+		# positions and leaf kinds, the score being the max over terms of the
+		# min over leaves (AND groups). Tables are padded with position n,
+		# a column that is always 0. Rules with necessary pairs do not fit
+		# this form; they are kept as parsed terms and evaluated per element.
+		self.__has_act = np.zeros(n, dtype=bool)
+		self.__has_inh = np.zeros(n, dtype=bool)
+		self.__is_complex = np.zeros(n, dtype=bool)
+		self.__complex = dict()
+		act_tables = n * [[]]
+		inh_tables = n * [[]]
+		for ele in update_list:
+			i = ele.get_index()
+			act_terms, inh_terms = ele.parse_rules()
+			self.__has_act[i] = len(act_terms) > 0
+			self.__has_inh[i] = len(inh_terms) > 0
+			act_table = leaf_table(act_terms)
+			inh_table = leaf_table(inh_terms)
+			if act_table is None or inh_table is None:
+				self.__is_complex[i] = True
+				self.__complex[i] = (act_terms, inh_terms)
+			else:
+				act_tables[i] = act_table
+				inh_tables[i] = inh_table
+		self.__act_pos, self.__act_kind = self.pad(act_tables)
+		self.__inh_pos, self.__inh_kind = self.pad(inh_tables)
+		# with only plain lists of regulators, the scores are a max over positions
+		self.__plain = self.__act_pos.shape[2]==1 and self.__inh_pos.shape[2]==1 \
+			and not self.__act_kind.any() and not self.__inh_kind.any()
+
+	def pad(self, tables):
+		""" returns the (elements x terms x leaves) arrays of positions and kinds of
+			the leaf tables, padded with the zero column
+		"""
+		terms = max([len(table) for table in tables] + [1])
+		leaves = max([len(term) for table in tables for term in table] + [1])
+		positions = np.full((len(tables), terms, leaves), self.__n, dtype=np.int64)
+		kinds = np.full((len(tables), terms, leaves), PAD, dtype=np.int8)
+		# a padding term scores 0
+		kinds[:, :, 0] = VAR
+		for i, table in enumerate(tables):
+			for t, term in enumerate(table):
+				for l, (pos, kind) in enumerate(term):
+					positions[i, t, l] = pos
+					kinds[i, t, l] = kind
+		return positions, kinds
+
+	def run(self, runs, simStep, trace=False, rng=None, steady_state=False, simtype='ra', steps=None):
+		""" Simulate all runs
+			Inputs:
+				runs : number of simulation runs
+				simStep : number of simulation steps
+				trace : also return the values of each run at each step
+				rng : numpy random Generator, by default seeded from the random module
+				steady_state : stop updating runs that reach an absorbing state,
+					keeping their values for the remaining steps
+					(or that cycle, with the deterministic 'sync' scheme)
+				simtype : simulation scheme, 'ra' (default) to update one random element
+					per step, 'round' to update every element once per step in a random
+					order, or 'sync' to update every element at once from the previous step
+				steps : sorted array of the steps to record (default: all steps)
+			Returns:
+				freq_sum : (steps x elements) array, sum of the values across runs at each recorded step
+				memo : (steps x runs x elements) array of values, or None if trace is False
+				values : (runs x elements) array of values at the end of each run
+		"""
+
+		steps = np.arange(simStep+1) if steps is None else steps
+		if simtype=='sync':
+			return self.run_sync(runs, simStep, trace, steady_state, steps)
+		elif simtype not in ('ra', 'round'):
+			raise ValueError('Unknown simulation scheme: '+str(simtype))
+
+		if rng is None:
+			rng = np.random.default_rng(random.getrandbits(64))
+
+		n = self.__n
+		rows = np.arange(runs)
+		# row of each step in freq_sum, -1 if the step is not recorded
+		recorded = np.full(simStep+1, -1)
+		recorded[steps] = np.arange(len(steps))
+
+		# values of every run, with an extra zero column used for padding
+		V = np.zeros((runs, n+1), dtype=np.int64)
+		V[:, :n] = self.__initial
+		# current delay values for spontaneous activation and inhibition
+		delay_act = np.zeros((runs, n), dtype=np.int64)
+		delay_inh = np.zeros((runs, n), dtype=np.int64)
+
+		freq_sum = np.zeros((len(steps), n), dtype=np.int64)
+		memo = None
+		if trace:
+			memo = np.zeros((len(steps), runs, n), dtype=np.min_scalar_type(max(int(self.__top.max(initial=0)), 1)))
+		if steps[0]==0:
+			freq_sum[0] = self.__values * runs
+			if trace:
+				memo[0] = V[:, :n]
+
+		# runs still being updated, and the sum of the values of the runs
+		# that reached an absorbing state
+		active = rows
+		settled = np.zeros(n, dtype=np.int64)
+		# number of steps without a value change of each run, and how many
+		# before checking whether its state is absorbing (doubled after each failed check)
+		unchanged = np.zeros(runs, dtype=np.int64)
+		patience = np.full(runs, max(len(self.__update), 1) if simtype=='ra' else 1, dtype=np.int64)
+
+		for step in range(1, simStep+1):
+			if not len(active):
+				rest = np.searchsorted(steps, step)
+				freq_sum[rest:] = settled
+				if trace:
+					memo[rest:] = V[:, :n]
+				break
+
+			if simtype=='round':
+				# each run updates every element once, in its own random order
+				order = rng.permuted(np.tile(self.__update, (len(active), 1)), axis=1)
+				changed = np.zeros(len(active), dtype=bool)
+				for chosen in order.T:
+					changed |= self.update(V, delay_act, delay_inh, active, chosen)
+			else:
+				# each run picks one element to update
+				chosen = self.__update[rng.integers(0, len(self.__update), size=len(active))]
+				changed = self.update(V, delay_act, delay_inh, active, chosen)
+			row = recorded[step]
+			if row >= 0:
+				if steady_state:
+					freq_sum[row] = V[active, :n].sum(axis=0) + settled
+				else:
+					freq_sum[row] = V[:, :n].sum(axis=0)
+				if trace:
+					memo[row] = V[:, :n]
+
+			if steady_state:
+				unchanged[active] = np.where(changed, 0, unchanged[active]+1)
+				ready = active[unchanged[active] >= patience[active]]
+				if len(ready):
+					unchanged[ready] = 0
+					stable = self.absorbing(V, delay_act, delay_inh, ready)
+					patience[ready[~stable]] *= 2
+					absorbed = ready[stable]
+					if len(absorbed):
+						settled += V[absorbed, :n].sum(axis=0)
+						active = active[~np.isin(active, absorbed)]
+
+		return freq_sum, memo, V[:, :n]
+
+	def run_sync(self, runs, simStep, trace, steady_state, steps):
+		""" Simulate all runs with the synchronous (sync) scheme, see run().
+			The scheme is deterministic, so all runs are the same: one run is
+			simulated and repeated. With steady_state, the simulation stops once
+			a state (values and delay counters) repeats, the remaining steps
+			following the cycle.
+		"""
+
+		n = self.__n
+		update = self.__update
+		# the run, updating every element of the update list at each step
+		V = np.zeros((1, n+1), dtype=np.int64)
+		V[0, :n] = self.__initial
+		delay_act = np.zeros((1, n), dtype=np.int64)
+		delay_inh = np.zeros((1, n), dtype=np.int64)
+		rows = np.zeros(len(update), dtype=np.int64)
+		recorded = np.full(simStep+1, -1)
+		recorded[steps] = np.arange(len(steps))
+
+		# values at the recorded steps, and with steady_state at every step
+		# along with the step at which each state was seen
+		record = np.zeros((len(steps), n), dtype=np.int64)
+		if steps[0]==0:
+			record[0] = V[0, :n]
+		if steady_state:
+			history = [V[0, :n].copy()]
+			seen = {V.tobytes() + delay_act.tobytes() + delay_inh.tobytes(): 0}
+		for step in range(1, simStep+1):
+			self.update(V, delay_act, delay_inh, rows, update)
+			if recorded[step] >= 0:
+				record[recorded[step]] = V[0, :n]
+			if steady_state:
+				key = V.tobytes() + delay_act.tobytes() + delay_inh.tobytes()
+				if key in seen:
+					# the run repeats the steps since the state was last seen
+					first = seen[key]
+					rest = np.searchsorted(steps, step, side='right')
+					record[rest:] = np.array(history)[first + (steps[rest:] - first) % (step - first)]
+					break
+				seen[key] = step
+				history.append(V[0, :n].copy())
+
+		freq_sum = record * runs
+		if steps[0]==0:
+			freq_sum[0] = self.__values * runs
+		memo = None
+		if trace:
+			memo = np.zeros((len(steps), runs, n), dtype=np.min_scalar_type(max(int(self.__top.max(initial=0)), 1)))
+			memo[:] = record[:, None, :]
+		return freq_sum, memo, np.repeat(record[-1:], runs, axis=0)
+
+	def update(self, V, delay_act, delay_inh, rows, chosen):
+		""" Update the chosen element of each run (row of V),
+			returns whether the value of the chosen element changed
+		"""
+
+		X_curr = V[rows, chosen]
+		X_next, hold_inh, done_inh, hold_act, done_act = self.transition(V, delay_act, delay_inh, rows, chosen)
+		delay_inh[rows[hold_inh], chosen[hold_inh]] += 1
+		delay_inh[rows[done_inh], chosen[done_inh]] = 0
+		delay_act[rows[hold_act], chosen[hold_act]] += 1
+		delay_act[rows[done_act], chosen[done_act]] = 0
+		V[rows, chosen] = X_next
+		return X_next != X_curr
+
+	def absorbing(self, V, delay_act, delay_inh, rows):
+		""" returns whether the state of each run in rows is absorbing,
+			no update changing its values or delay counters
+		"""
+
+		update = self.__update
+		stable = np.zeros(len(rows), dtype=bool)
+		# check the runs in chunks, all elements of a run at once
+		chunk = max(1, CHECK_SIZE // len(update))
+		for start in range(0, len(rows), chunk):
+			part = rows[start:start+chunk]
+			part_rows = np.repeat(part, len(update))
+			part_chosen = np.tile(update, len(part))
+			X_next, hold_inh, done_inh, hold_act, done_act = self.transition(
+				V, delay_act, delay_inh, part_rows, part_chosen)
+			same = (X_next==V[part_rows, part_chosen]) & ~hold_inh & ~hold_act
+			stable[start:start+chunk] = same.reshape(len(part), len(update)).all(axis=1)
+		return stable
+
+	def transition(self, V, delay_act, delay_inh, rows, chosen):
+		""" returns the next value of the chosen element of each run (row of V),
+			and the runs where its inhibition and activation delay counters
+			are incremented (hold) or reset (done)
+		"""
+
+		X_curr = V[rows, chosen]
+		N = self.__top[chosen]
+
+		# activation and inhibition scores
+		if self.__plain:
+			y_act = V[rows[:, None], self.__act_pos[chosen, :, 0]].max(axis=1)
+			y_inh = V[rows[:, None], self.__inh_pos[chosen, :, 0]].max(axis=1)
+		else:
+			y_act = self.score(V, rows, N, self.__act_pos[chosen], self.__act_kind[chosen])
+			y_inh = self.score(V, rows, N, self.__inh_pos[chosen], self.__inh_kind[chosen])
+		complex_rows = np.nonzero(self.__is_complex[chosen])[0]
+		if len(complex_rows):
+			for i in np.unique(chosen[complex_rows]):
+				sub = complex_rows[chosen[complex_rows]==i]
+				act_terms, inh_terms = self.__complex[i]
+				if act_terms:
+					y_act[sub] = evaluate_terms(act_terms, V[rows[sub]], self.__top[i])
+				if inh_terms:
+					y_inh[sub] = evaluate_terms(inh_terms, V[rows[sub]], self.__top[i])
+
+		has_act = self.__has_act[chosen]
+		has_inh = self.__has_inh[chosen]
+		# increase if activation > 0 (only activators) or activation > inhibition (both),
+		# otherwise spontaneously decay after the inhibition delay
+		rise = (has_act & ~has_inh & (y_act > 0)) | (has_act & has_inh & (y_act > y_inh))
+		decay = has_act & ~rise
+		# decrease if inhibition > 0 (only inhibitors),
+		# otherwise spontaneously increase after the activation delay
+		fall = ~has_act & has_inh & (y_inh > 0)
+		grow = ~has_act & has_inh & ~fall
+
+		X_next = X_curr.copy()
+		X_next[rise & (X_curr < N)] += 1
+		X_next[fall & (X_curr > 0)] -= 1
+
+		decaying = decay & (X_curr > 0)
+		hold_inh = decaying & (delay_inh[rows, chosen] < self.__delay_inh[chosen])
+		done_inh = decaying & ~hold_inh
+		X_next[done_inh] -= 1
+
+		growing = grow & (X_curr < N)
+		hold_act = growing & (delay_act[rows, chosen] < self.__delay_act[chosen])
+		done_act = growing & ~hold_act
+		X_next[done_act] += 1
+
+		# keep X_next within the state value bounds
+		return np.clip(X_next, 0, N), hold_inh, done_inh, hold_act, done_act
+
+
+	def score(self, V, rows, N, positions, kinds):
+		""" returns the score of the leaf tables (runs x terms x leaves) of the chosen elements """
+
+		N = N[:, None, None]
+		val = V[rows[:, None, None], positions]
+		negated = kinds==NOT
+		if (negated & (val > N)).any():
+			raise ValueError('Can''t compute NOT, input is greater than max state')
+		val = np.where(negated, N - val, val)
+		val = np.where(kinds==HIGHEST, (val==N) * 2, val)
+		val = np.where(kinds==NOT_HIGHEST, (val!=N) * 1, val)
+		val = np.where(kinds==PAD, np.iinfo(np.int64).max, val)
+		return val.min(axis=2).max(axis=1)
+
+
+# number of (run, element) pairs evaluated at once when checking for absorbing states
+CHECK_SIZE = 1 << 16
+
+# kinds of leaves in a leaf table
+VAR = 0
+NOT = 1
+HIGHEST = 2
+NOT_HIGHEST = 3
+PAD = 4
+LEAF_KINDS = {'var': VAR, 'not': NOT, 'highest': HIGHEST, 'not_highest': NOT_HIGHEST}
+
+def leaf_table(terms):
+	""" returns a parsed rule as a list of terms, each a list of (position, kind) leaves
+		combined by min, or None if the rule contains necessary pairs
+	"""
+
+	table = list()
+	for term in terms:
+		if term[0] in LEAF_KINDS:
+			table.append([(term[1], LEAF_KINDS[term[0]])])
+		elif term[0]=='and':
+			# nested AND groups flatten into one min
+			leaves = leaf_table(term[1])
+			if leaves is None:
+				return None
+			table.append([leaf for and_term in leaves for leaf in and_term])
+		else:
+			return None
+	return table
+
+def evaluate_terms(terms, V, N):
+	""" returns the score of a parsed rule (max over its terms) for each row of V
+		Inputs:
+			terms : list of terms from parse_rule
+			V : (runs x elements) matrix of values
+			N : highest state of the regulated element
+	"""
+	return np.max(np.stack([evaluate_term(term, V, N) for term in terms]), axis=0)
+
+def evaluate_term(term, V, N):
+	""" returns the score of one term for each row of V """
+
+	op = term[0]
+	if op=='var':
+		return V[:, term[1]]
+	elif op=='not':
+		x = V[:, term[1]]
+		if (x > N).any():
+			raise ValueError('Can''t compute NOT, input is greater than max state')
+		return N - x
+	elif op=='highest':
+		return (V[:, term[1]]==N) * 2
+	elif op=='not_highest':
+		return (V[:, term[1]]!=N) * 1
+	elif op=='and':
+		return np.min(np.stack([evaluate_term(t, V, N) for t in term[1]]), axis=0)
+	elif op=='pair':
+		y_must = np.stack([evaluate_term(t, V, N) for t in term[1]])
+		y_enhance = np.stack([evaluate_term(t, V, N) for t in term[2]])
+		score = np.clip(np.maximum(y_must.min(axis=0), y_enhance.max(axis=0)), 0, N)
+		return np.where((y_must==0).all(axis=0), 0, score)
+	else:
+		raise ValueError('Unknown rule term: '+str(op))
@@ -21,6 +21,8 @@ setup(
     install_requires=[
         'networkx',
         'matplotlib',
+        'numpy',
+        'scipy',
         'openpyxl'
     ],
     zip_safe=False # install as directory
@@ -6,13 +6,18 @@ import re
 import pickle
 import random
 # import openpyxl
+import numpy as np
 import networkx as nx
 # from networkx import *
 # import multiprocessing
 import matplotlib.pyplot as plt
 # from collections import Counter
 import Simulator.simulator as sim
+from Simulator.trace import TraceReader, is_binary_trace
+from Simulator.modelfile import ModelDocument, load_model, model_rows, model_cache, save_model, write_model_rows, convert_model
 from datetime import datetime as dt
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 # from joblib import Parallel, delayed
 from openpyxl import Workbook, load_workbook
 # from networkx.drawing.nx_agraph import graphviz_layout
@@ -31,7 +36,7 @@ from openpyxl import Workbook, load_workbook
 # from joblib import Parallel, delayed
 
 
-def add_regulation_to_directed_network(G,positive_probability):
+def add_regulation_to_directed_network(G,positive_probability, seed = None):
     """Adds positive and negative regulation attributes to each edges of graph G.
 
     Parameters
@@ -42,6 +47,9 @@ def add_regulation_to_directed_network(G,positive_probability):
     positive_probability : float [0-1]
         The probability that a edge in the network is positive.
 
+    seed : integer [default = None]
+        Seed of the random number generator, for a reproducible network. By default it is seeded from system entropy.
+
 
     Returns
     -------
@@ -52,7 +60,7 @@ def add_regulation_to_directed_network(G,positive_probability):
     H = nx.DiGraph(weight=1,typ='+')
 
     #Seed the random number generator
-    random.seed()
+    rng = random.Random(seed)
 
     #Iterate through graph G, assigning regulation before adding it to H. 
     for edge in G.edges():
@@ -62,7 +70,7 @@ def add_regulation_to_directed_network(G,positive_probability):
         to_node = str(edge[1])
 
         #Select a random number
-        chance = random.random()
+        chance = rng.random()
         
         #Using a random number to determine if the regulation is positive or negative depending upon the 'positive_probability'.
         if chance > positive_probability: H.add_edge(from_node,to_node,weight=1,typ='-')
@@ -101,7 +109,7 @@ def add_direction_to_undirected_network(G):
     return H
 
 
-def graph_maker(network_type, nodes, positive_probability, edge_probability=0.5, attaching_edges=2):
+def graph_maker(network_type, nodes, positive_probability, edge_probability=0.5, attaching_edges=2, seed=None):
     """Automatically creates a directed network with positive and negative edges of a particular type.
 
     Parameters
@@ -129,6 +137,9 @@ def graph_maker(network_type, nodes, positive_probability, edge_probability=0.5,
     attaching_edges : int [must be >=1 but <nodes]
         Only affectes network_type == 5. This parameter specifies the number of edges to attach from a new node to existing nodes.
 
+    seed : int [default = None]
+        Seed of the random number generators, for a reproducible network. By default they are seeded from system entropy.
+
 
     Returns
     -------
@@ -141,28 +152,28 @@ def graph_maker(network_type, nodes, positive_probability, edge_probability=0.5,
 
     #Creation of a growing network (GN) digraph with n nodes.
     if network_type == 1:
-        G = nx.gn_graph(nodes)
+        G = nx.gn_graph(nodes, seed = seed)
 
     #Creation of a growing network with redirection (GNR) digraph with n nodes and redirection probability p.
     elif network_type == 2:
         #Here 'edge_probability' referes the the probability and edge is redirected.
-        G = nx.gnr_graph(nodes, edge_probability)
+        G = nx.gnr_graph(nodes, edge_probability, seed = seed)
 
     #Creation of a growing network with copying (GNC) digraph with n nodes.
     elif network_type == 3:
-        G = nx.gnc_graph(nodes)
+        G = nx.gnc_graph(nodes, seed = seed)
 
     #Creation of an Erdős-Rényi graph or a binomial graph.
     elif network_type == 4:
         #Here 'edge_probability' referes the the probability that an edge is created.
-        G = nx.gnp_random_graph(nodes, edge_probability, directed = True)
+        G = nx.gnp_random_graph(nodes, edge_probability, seed = seed, directed = True)
     
     #Creation of a random graph according to the Barabási–Albert preferential attachment model.
     elif network_type == 5:
         # In this type of graph, we must:
         #       specify the initial number of starting edges (attaching_edges)
         #       transform the undirected graph into a DiGraph()
-        G = nx.barabasi_albert_graph(nodes, attaching_edges)
+        G = nx.barabasi_albert_graph(nodes, attaching_edges, seed = seed)
         G = add_direction_to_undirected_network(G)
 
     #Specified network_type was invalid
@@ -170,7 +181,7 @@ def graph_maker(network_type, nodes, positive_probability, edge_probability=0.5,
         print("Variable \'network_type\' not a recognized input.")
         return Network
 
-    Network = add_regulation_to_directed_network(G,positive_probability)
+    Network = add_regulation_to_directed_network(G,positive_probability,seed)
     return Network
 
 
@@ -432,7 +443,7 @@ def create_initial_values(G, initial=1):
     return initial_val_dic
 
 
-def create_initial_values_random(G, lower_bound = 0, upper_bound = 2):
+def create_initial_values_random(G, lower_bound = 0, upper_bound = 2, seed = None):
     """Returns a dictionary with RANDOM initial values for each node in G.
 
     Parameters
@@ -446,6 +457,9 @@ def create_initial_values_random(G, lower_bound = 0, upper_bound = 2):
     upper_bound : integer [default = 2]
         An integer value which serves as the highest possible initial value permitted for a node in the network. 
 
+    seed : integer [default = None]
+        Seed of the random number generator, for reproducible initial values. By default it is seeded from system entropy.
+
 
     Returns
     -------
@@ -456,7 +470,7 @@ def create_initial_values_random(G, lower_bound = 0, upper_bound = 2):
     initial_val_dic = {}
 
     #Seed the random generator
-    random.seed()
+    rng = random.Random(seed)
 
     #Iterate through the network edges in G
     for edge in G.edges():
@@ -465,16 +479,16 @@ def create_initial_values_random(G, lower_bound = 0, upper_bound = 2):
 
         #Make sure we have not already initialized the source
         if source not in initial_val_dic:
-            initial_val_dic[source] = random.randrange(lower_bound,upper_bound+1,1)
+            initial_val_dic[source] = rng.randrange(lower_bound,upper_bound+1,1)
 
          #Make sure we have not already initialized the target
         if target not in initial_val_dic:
-            initial_val_dic[target] = random.randrange(lower_bound,upper_bound+1,1)
+            initial_val_dic[target] = rng.randrange(lower_bound,upper_bound+1,1)
 
     return initial_val_dic
 
 
-def network_to_excel(G, filename = "network_full.xlsx"):
+def network_to_excel(G, filename = "network_full.xlsx", initial_values = None, expected_values = None):
     """Saves the Network G to an excel file in a standardized format.
 
     Parameters
@@ -484,118 +498,200 @@ def network_to_excel(G, filename = "network_full.xlsx"):
     
     filename : string [default = 'network_full.xlsx']
         The filename for the output to be save to.  
+        A filename ending in .jsonl saves the network as a native model file (see convert_model_file).
 
-    """ 
-    #Initialize dictionary to remember the row for each unique network node.
-    name_to_row = {}
-
-    #Initialize the excel workbook so that we can begin to save the network.
-    wb = Workbook()
-    ws = wb.active
+    initial_values : dictionary [default = None]
+        If specified, a dictionary with keys for each node and values for the node's initial value (column 6), \
+            e.g. from create_initial_values. Saves a separate update_network_file pass.
 
-    #Create standardized column headers for easy reading
-    ws.cell(row=1,column=1,value='Element')
-    ws.cell(row=1,column=2,value='Positive Regulators')
-    ws.cell(row=1,column=3,value='Negative Regulators')
-    ws.cell(row=1,column=6,value='Initial Values')
-    ws.cell(row=1,column=7,value='Expected Values')
+    expected_values : dictionary [default = None]
+        If specified, a dictionary with keys for each node and values for the node's expected end value (column 7).
 
-    #Initialize and begin iteration scheme to translate nodes to rows
-    curr_row = 2
-    for edge in G.edges():
-        source = edge[0]
-        target = edge[1]
+    """ 
+    #Initialize dictionaries to remember the order of the network nodes (one row each)
+    # and to group the positive and negative regulators of each node, in the order of the edges
+    positive_regulators = {}
+    negative_regulators = {}
+
+    #Single pass through the edges to translate nodes to rows, and group the regulators of each target
+    for source, target, typ in G.edges(data='typ'):
+        #Add the source and target nodes to the rows, in the order they first appear
+        if source not in positive_regulators:
+            positive_regulators[source] = []
+            negative_regulators[source] = []
+        if target not in positive_regulators:
+            positive_regulators[target] = []
+            negative_regulators[target] = []
+
+        #Add the regulation information, determining the type of regulation
+        if typ == '+': positive_regulators[target].append(str(source))
+        else: negative_regulators[target].append(str(source))
+
+    #Create one row per node, after standardized column headers for easy reading
+    def rows():
+        yield ['Element', 'Positive Regulators', 'Negative Regulators', None, None, 'Initial Values', 'Expected Values']
+        for node in positive_regulators:
+            row = [node, ','.join(positive_regulators[node]) or None, ','.join(negative_regulators[node]) or None, None, None]
+            row.append(initial_values.get(node) if initial_values is not None else None)
+            row.append(expected_values.get(node) if expected_values is not None else None)
+            yield row
+
+    #Saving the file (excel or native, by the file extension), streaming the rows
+    write_model_rows(filename, rows())
+
+
+def update_network_file(filename, update_column, update_values, verbose = True):
+    """Function to quickly input initial and final values for simulations. 
+    To update several columns at once, use update_network_columns.
 
-        #Check to see if the source node has already been added to the excel
-        if source not in name_to_row:
-            #Add source to location dictionary
-            name_to_row[source] = curr_row
+    Parameters
+    ----------
+    filename : string 
+        The filename of the network excel file.  
 
-            #Add source to excel and initialize it      
-            ws.cell(row=curr_row,column=1,value=source)
-            
-            #Increment the current row, so we don't write over it
-            curr_row += 1
+    update_column : integer
+        The column location you wish to update. Frequently this is the initial values column (6), or the final values column (7). 
 
-        #Check to see if the target node has already been added to the excel
-        if target not in name_to_row:
-            #Add target to location dictionary
-            name_to_row[target] = curr_row
+    update_values : dictionary
+        A dictionary with keys for each node in the network file, and the corresponding values you wish to input for that row (values).
+    
+    verbose : Bool [default = True]
+        Whether or not to print the nodes that were given no value, and the nodes that are not in the network.
+        True = Yes
+        False = No
 
-            #Add target to excel and initialize it         
-            ws.cell(row=curr_row,column=1,value=target)
-            
-            #Increment the current row, so we don't write over it
-            curr_row += 1
+    Returns
+    -------
+    unmatched : dictionary
+        The nodes that could not be matched, see update_network_columns.
 
-        #Add the regulation information
-        #Determine the type of regulation
-        if G[source][target]['typ'] == '+': col = 2
-        else: col = 3
+    """
+    #Update the column in a single load and save of the network file
+    unmatched = update_network_columns(filename, {update_column: update_values})
 
-        #Determining if we must append information, or if this is the first regulator of the target
-        original = ws.cell(row=name_to_row[target],column=col).value
-        if original == None: regulation_info = str(source)
-        else: regulation_info = original + ',' + str(source)
+    #Report the nodes given no value, and the update_values that were not used
+    if verbose:
+        for node in unmatched['nodes_without_values'][update_column]:
+            print("Node: " + str(node) + " was given no value to update!")
+        for key in unmatched['nodes_not_in_network'][update_column]:
+            print("Node: " + str(key) + " does not exist in this network and therefore could not be updated!") 
 
-        #Adding the regulation information into the excel
-        ws.cell(row=name_to_row[target],column=col,value=regulation_info)
-    
-    #Saving the file
-    wb.save(filename)
+    return unmatched
 
 
-def update_network_file(filename, update_column, update_values):
-    """Function to quickly input initial and final values for simulations. 
+def update_network_columns(filename, column_values, add_missing_nodes = False):
+    """Function to input several columns of values (e.g. initial and expected values) into a network file at once, \
+        loading and saving the file a single time. 
 
     Parameters
     ----------
     filename : string 
-        The filename of the network excel file.  
+        The filename of the network file (excel or native).  
 
-    update_column : integer
-        The column location you wish to update. Frequently this is the initial values column (6), or the final values column (7). 
+    column_values : dictionary
+        A dictionary with keys for each column location you wish to update, and values for the dictionary of the values of that column, \
+            with keys for each node and the corresponding values you wish to input for that row. 
+        Example: {6: initial_values, 7: expected_values}
 
-    update_values : dictionary
-        A dictionary with keys for each node in the network file, and the corresponding values you wish to input for that row (values).
-    
-    """
-    #Initialize key variable to ensure not too many values were given to update
-    updated_nodes = []
+    add_missing_nodes : Bool [default = False]
+        Whether or not to add the nodes that are not in the network file as new rows (e.g. nodes without any connections), \
+            after the last node. Otherwise their values are not used.
+        True = Yes
+        False = No
+
+    Returns
+    -------
+    unmatched : dictionary
+        The nodes that could not be matched, instead of printing them:
+        'nodes_without_values' : a dictionary with keys for each updated column, and values for the list of the nodes of the network \
+            given no value for that column (left unchanged). 
+        'nodes_not_in_network' : a dictionary with keys for each updated column, and values for the list of the nodes given a value \
+            for that column that are not in the network (empty if add_missing_nodes). 
+        'added_nodes' : the list of the nodes added as new rows. 
 
-    #Loading the network file excel
-    wb = load_workbook(filename)
+    """
+    #Loading the network file (excel or native)
+    wb = load_model(filename)
     ws = wb.active
 
-    #Initializing and iterating through the file row by row
-    current_row = 2
-    for idx, rows in enumerate(ws.iter_rows(),start=1):
-        node = rows[0].value
-        
-        #Check to make sure we are in a valid row
-        if (node is None) or (node.lower()=="element"): continue
+    #Identify the row location of each node, skipping empty rows and the header
+    row_location_of_node = dict()
+    max_row = 1
+    for idx, row in enumerate(ws.iter_rows(max_col=1, values_only=True), start=1):
+        node = row[0]
+        if (node is None) or (str(node).lower()=="element"): continue
+        row_location_of_node[node] = idx
+        max_row = idx
+
+    #Initialize the structure reporting the unmatched nodes
+    unmatched = {'nodes_without_values': dict(), 'nodes_not_in_network': dict(), 'added_nodes': []}
+
+    #Update the columns one at a time
+    for update_column, update_values in column_values.items():
+        unmatched['nodes_not_in_network'][update_column] = []
+        for node, value in update_values.items():
+            #Add the nodes not yet in the network file, if requested, in the first row after the last node
+            if node not in row_location_of_node:
+                if not add_missing_nodes:
+                    unmatched['nodes_not_in_network'][update_column].append(node)
+                    continue
+                max_row += 1
+                ws.cell(row=max_row, column=1, value=str(node))
+                row_location_of_node[node] = max_row
+                unmatched['added_nodes'].append(node)
 
-        #Check to make sure we have an update value for this node
-        if node in update_values.keys(): 
             #Update the row value with the correct value from the dictionary
-            ws.cell(row=current_row, column=update_column, value=update_values[node])
-            updated_nodes.append(node)
+            ws.cell(row=row_location_of_node[node], column=update_column, value=value)
 
-        else:
-            print("Node: " + str(node) + " was given no value to update!")
-        
-        #Updating the current row
-        current_row += 1
+    #Check which nodes were given no value for each column
+    for update_column, update_values in column_values.items():
+        unmatched['nodes_without_values'][update_column] = [node for node in row_location_of_node if node not in update_values]
 
-    #Check to make sure no update_values were not used:
-    for key in update_values.keys(): 
-        if key not in updated_nodes:
-            print("Node: " + str(key) + " does not exist in this network and therefore could not be updated!") 
     #Save updated network file
-    wb.save(filename)
+    save_model(wb, filename)
 
+    return unmatched
 
-def simulate_network(filename, simulation_runs, simulation_length, output_file = "network_trace.txt"):
+
+def convert_model_file(filename, output_name):
+    """Converts a network file between the excel (.xlsx) and native (.jsonl) model formats, the format being chosen by the file extension. 
+
+    Every function reading or writing network files accepts both formats. The native format holds the same columns as the excel file \
+        (one JSON list of the cell values of each row per line) and is much faster to load and save on large networks.
+    The conversion is lossless, so that a converted file converts back to the same table of values. 
+
+    Parameters
+    ----------
+    filename : string 
+        The filename of the network file to convert.  
+        Example = "network_full.xlsx"
+
+    output_name : string 
+        The filename of the converted network file.  
+        Example = "network_full.jsonl"
+
+    """
+    convert_model(filename, output_name)
+
+
+def set_model_cache_size(max_bytes):
+    """Sets the memory bound of the cache of parsed network files shared by the simulator and the functions reading network files. 
+
+    Each network file is parsed once and its table of values kept until the file changes (its size or modification time), \
+        so that the repeated loads of the current best model during BFA and DFA do not parse it again. 
+    The least recently used files are evicted beyond max_bytes (256 MB by default). 
+
+    Parameters
+    ----------
+    max_bytes : integer 
+        The approximate memory, in bytes, that the cache may hold. 0 disables the cache. 
+
+    """
+    model_cache.resize(max_bytes)
+
+
+def simulate_network(filename, simulation_runs, simulation_length, output_file = "network_trace.txt", engine = "scalar", workers = 1, trace_format = "text", tolerance = None, min_runs = 10, steady_state = False, \
+                     update_scheme = "ra", record = "all", profile_file = None):
     """Simulate an initialized network file. 
 
     Parameters
@@ -615,38 +711,114 @@ def simulate_network(filename, simulation_runs, simulation_length, output_file =
     output_file : string [default = "network_trace.txt"]
         The name of the file in which the simulation trace will be saved. 
 
+    engine : string [default = "scalar"]
+        The simulation engine to use:
+            "scalar" = simulate one run at a time.
+            "vectorized" = advance all runs together as a (runs x elements) matrix, much faster when simulation_runs is large.
+            "bitplane" = advance the runs 64 at a time as the bits of machine words, for networks whose nodes all have \
+                2 or 3 states (max_state); faster still for small networks.
+            "exact" = compute the expected node values exactly from the Markov chain of the update scheme, as if averaged over \
+                infinitely many simulations. Only for tiny models: the reachable node values and delay counters are enumerated, \
+                and a model is accepted only if the product of the numbers of values and delay counter values of its regulated nodes \
+                is at most 65536 (about 4 regulated nodes of 3 states). Larger models are simulated with the "vectorized" engine \
+                instead, with a warning. No simulation run is saved to the trace, only the Frequency Summary.
+
+    workers : integer [default = 1]
+        The number of processes to share the simulation runs between. Each process simulates a contiguous block of runs \
+            with its own random stream, derived from the random module so that random.seed() keeps results reproducible.
+
+    trace_format : string [default = "text"]
+        The format of the simulation trace file:
+            "text" = the text Frequency Summary.
+            "binary" = a compact binary file of the same sums, memory-mapped when read back (see Simulator/trace.py). \
+                get_simulation_end_values reads both formats.
+
+    tolerance : float [default = None]
+        If specified, simulate adaptively: runs are performed in batches until the confidence interval (95%) of the score of the end values \
+            is narrower than +/- tolerance, with simulation_runs as the maximum number of runs. By default all simulation_runs are performed.
+
+    min_runs : integer [default = 10]
+        The minimum number of runs of an adaptive simulation, see tolerance.
+
+    steady_state : Bool [default = False]
+        Whether or not to end each simulation run as soon as it reaches an absorbing state, in which no update can change the network, \
+            filling the remaining time-steps with its final values. The results follow the same distribution, but are not identical \
+            to those of a full simulation with the same random seed.
+        True = Yes
+        False = No
+
+    update_scheme : string [default = "ra"]
+        The order in which nodes are updated:
+            "ra" = random asynchronous, one random node is updated at each time-step.
+            "round" = every node is updated once at each time-step, in a random order.
+            "sync" = synchronous, every node is updated at once from the values of the previous time-step. \
+                This scheme is deterministic, and with steady_state a run also ends as soon as it enters a cycle.
+
+    record : string or tuple [default = "all"]
+        The time-steps saved to the trace file, to bound its size and the memory used for long simulations:
+            "all" = every time-step, from the initial values (time-step 0) to the end.
+            "end" = only the last time-step.
+            ("every", k) = every k-th time-step, and the last one.
+            ("last", W) = the last W time-steps, e.g. to average the end values over time with get_simulation_end_values.
+        Unless all time-steps are saved, the trace lists the saved time-steps after the Frequency Summary header.
+
+    profile_file : string [default = None]
+        If specified, the name of a CSV file in which to save a table of the updates of each node, to find the nodes that make \
+            the simulation slow: how often the node was updated, how often its value changed, the time spent updating it (in total \
+            and per update), and the number of regulators and nesting depth of its rules. Only with the "scalar" engine.
+        Example = "network_profile.csv"
+
+    Returns
+    -------
+    runs : integer
+        The number of simulation runs performed, needed by get_simulation_end_values after an adaptive simulation.
+
     """
     #Initialization of key variables relevant to the simulator
     output_mode = 3
-    update_scheme = "ra"
     column_with_initial_values = 6
 
     #Load the Network into the simulator
     model_run = sim.Manager(filename, column_with_initial_values)
 
-    #Run the simulator
-    model_run.run_simulation(update_scheme, simulation_runs, simulation_length, output_file, outMode=output_mode)
+    #Run the simulator, profiling the updates of the nodes if requested
+    profile = model_run.new_profile() if profile_file is not None else None
+    model_run.run_simulation(update_scheme, simulation_runs, simulation_length, output_file, outMode=output_mode, engine=engine, workers=workers, trace_format=trace_format, \
+        tolerance=tolerance, min_runs=min_runs, steady_state=steady_state, record=record, profile=profile)
+    if profile is not None: profile.write_table(profile_file)
 
+    return model_run.get_runs_used()
 
-def get_simulation_end_values(filename, simulation_runs):
+
+def get_simulation_end_values(filename, simulation_runs, time_average = False):
     """Returns the end values of the network simulation, based on the simulation trace file. 
     The variable 'simulation_runs' is necessary to normalize the end_values based on the number of simulations performed. 
 
     Parameters
     ----------
     filename : string 
-        The name of the txt file with the simulation trace output. 
+        The name of the file with the simulation trace output, either a text or a binary trace. 
         Example = "network_trace.txt"
 
     simulation_runs : integer
         The number of simulations to run. This is necessary as the simulator is stochastic, and you can observe different behavior with each simulation. 
         Example = 10 
 
+    time_average : Bool [default = False]
+        Whether or not to average the values over all the time-steps saved to the trace, instead of taking the last time-step, \
+            e.g. after simulate_network with record = ("last", W).
+        True = Yes
+        False = No
+
     Returns
     -------
     end_values : dictionary
         A dictionary with keys for each node in the network file, and values for the node's end value after simulation.
     """
+    #Binary traces hold the sums across simulations directly
+    if is_binary_trace(filename):
+        return TraceReader(filename).get_end_values(simulation_runs, time_average)
+
     #Initialization of key variables to hold values
     end_values = {}
 
@@ -655,8 +827,8 @@ def get_simulation_end_values(filename, simulation_runs):
         trace_file.readline()
         for line in trace_file:
 
-            #Skip the header
-            if "Frequency" in line: continue
+            #Skip the header and the list of saved time-steps
+            if "Frequency" in line or line.startswith("Recorded steps:"): continue
 
             #Cleaning the line
             line = line.strip()
@@ -667,7 +839,8 @@ def get_simulation_end_values(filename, simulation_runs):
             clean_node = clutter_node.split("|")[0]
 
             #Parsing the end value
-            end_value = float(values[-1])
+            if time_average: end_value = sum([float(x) for x in values[1:]])/len(values[1:])
+            else: end_value = float(values[-1])
             normalized_end_value = end_value/simulation_runs
 
             #Saving the node and its end value
@@ -676,6 +849,121 @@ def get_simulation_end_values(filename, simulation_runs):
     return end_values
 
 
+def simulate_network_end_values(model, simulation_runs, simulation_length, output_file = None, engine = "scalar", workers = 1, return_frequencies = False, trace_format = "text", seed = None, \
+                                tolerance = None, min_runs = 10, return_runs = False, steady_state = False, update_scheme = "ra", record = "all", \
+                                time_average = False, profile_file = None):
+    """Simulate a network and return the end values of the simulation directly from memory, without writing and parsing a trace file. 
+    Equivalent to simulate_network followed by get_simulation_end_values.
+
+    Parameters
+    ----------
+    model : string, sim.Manager or nx.DiGraph()
+        The name of the excel file with the initialized network, a network already loaded into the simulator, \
+            or a network graph (simulated with every node initialized at 1, as with create_initial_values). 
+        Example = "network_full.xlsx"
+
+    simulation_runs : integer
+        The number of simulations to run. This is necessary as the simulator is stochastic, and you can observe different behavior with each simulation. 
+        Example = 10 
+
+    simulation_length : integer
+        The number of time-steps or simulation updates performed during a simulation run.
+        Example = 100
+
+    output_file : string [default = None]
+        If specified, the simulation trace is also saved to this file, as in simulate_network.
+
+    engine : string [default = "scalar"]
+        The simulation engine to use, see simulate_network.
+
+    workers : integer [default = 1]
+        The number of processes to share the simulation runs between, see simulate_network.
+
+    return_frequencies : Bool [default = False]
+        Whether or not to also return the sum of each node's value across simulations at every time-step.
+        True = Yes
+        False = No
+
+    trace_format : string [default = "text"]
+        The format of the saved simulation trace, see simulate_network.
+
+    seed : integer [default = None]
+        Seed of the random stream of the simulation. Simulating different models with the same seed gives them common random numbers, \
+            so that differences between their end values come from the models rather than from the simulation noise. \
+            By default the random module is used.
+
+    tolerance : float [default = None]
+        If specified, simulate adaptively until the score of the end values is known within +/- tolerance, \
+            with simulation_runs as the maximum number of runs, see simulate_network.
+
+    min_runs : integer [default = 10]
+        The minimum number of runs of an adaptive simulation.
+
+    return_runs : Bool [default = False]
+        Whether or not to also return the number of simulation runs performed.
+        True = Yes
+        False = No
+
+    steady_state : Bool [default = False]
+        Whether or not to end each simulation run once it reaches an absorbing state, see simulate_network.
+
+    update_scheme : string [default = "ra"]
+        The order in which nodes are updated, "ra", "round" or "sync", see simulate_network.
+
+    record : string or tuple [default = "all"]
+        The time-steps kept in memory (and saved to output_file), "all", "end", ("every", k) or ("last", W), see simulate_network. \
+            With "end", the memory used no longer grows with simulation_length.
+
+    time_average : Bool [default = False]
+        Whether or not to average the end values over all the kept time-steps, see get_simulation_end_values.
+        True = Yes
+        False = No
+
+    profile_file : string [default = None]
+        If specified, the name of a CSV file in which to save a table of the updates of each node, see simulate_network.
+
+    Returns
+    -------
+    end_values : dictionary
+        A dictionary with keys for each node in the network file, and values for the node's end value after simulation.
+
+    frequencies : dictionary
+        Only returned if return_frequencies == True. A dictionary with keys for each node in the network file, \
+            and values for the list of the node's value summed across simulations at each kept time-step (see record).
+
+    runs : integer
+        Only returned if return_runs == True. The number of simulation runs performed.
+    """
+    #Initialization of key variables relevant to the simulator
+    output_mode = 3
+    column_with_initial_values = 6
+
+    #Load the Network into the simulator, unless it is already loaded
+    if isinstance(model, sim.Manager): model_run = model
+    elif isinstance(model, nx.DiGraph): model_run = sim.Manager.from_graph(model)
+    else: model_run = sim.Manager(model, column_with_initial_values)
+    if seed is not None: model_run.seed(seed)
+
+    #Run the simulator, only saving the trace if an output file is specified
+    profile = model_run.new_profile() if profile_file is not None else None
+    if output_file is None:
+        freq_sum = model_run.simulate(simulation_runs, simulation_length, engine=engine, workers=workers, tolerance=tolerance, min_runs=min_runs, \
+            steady_state=steady_state, simtype=update_scheme, record=record, profile=profile)
+    else:
+        freq_sum = model_run.run_simulation(update_scheme, simulation_runs, simulation_length, output_file, outMode=output_mode, engine=engine, workers=workers, trace_format=trace_format, \
+            tolerance=tolerance, min_runs=min_runs, steady_state=steady_state, record=record, profile=profile)
+    if profile is not None: profile.write_table(profile_file)
+
+    #Normalize the values at the last time-step by the number of simulations performed
+    runs = model_run.get_runs_used()
+    end_values = model_run.get_end_values(freq_sum, runs, time_average)
+
+    results = (end_values,)
+    if return_frequencies: results += (model_run.get_frequencies(freq_sum),)
+    if return_runs: results += (runs,)
+    return results if len(results) > 1 else end_values
+
+
 def get_model_expected_values(filename):
     """Function to quickly retrieve the expected values for a model's simulation. 
     Used to be "get_golden"
@@ -693,24 +981,23 @@ def get_model_expected_values(filename):
     #Define expected column of end values
     end_val_col = 6
 
-    #Load excel model file
-    wb = load_workbook(filename)
-    ws = wb.active
+    #Get the rows of the model file (excel or native), parsed once and cached until the file changes
+    rows = model_rows(filename)
 
     #Initialize variable dictionary to hold end values
     end_values = dict()
 
     #Iterate through the model file to find end values
-    for row in ws.iter_rows():
+    for row in rows:
         #Basic filtration to ensure the wrong keys are not taken
-        if row[0].value is None: continue
-        if row[0].value.lower()=="variable name": continue
-        if row[0].value.lower()=="element": continue
-        if len(row)<end_val_col: continue
-        if row[end_val_col].value is None: continue
+        if not row or row[0] is None: continue
+        if row[0].lower()=="variable name": continue
+        if row[0].lower()=="element": continue
+        if len(row)<=end_val_col: continue
+        if row[end_val_col] is None: continue
 
         #Adding elements to the dictionary with their end values as floats
-        end_values[row[0].value] = float(row[end_val_col].value) 
+        end_values[row[0]] = float(row[end_val_col]) 
 
     return end_values
 
@@ -765,14 +1052,12 @@ def find_element_locations(filename):
     #Initialize key dictionary
     row_location_of_element = dict()
 
-    #Load model file and begin iterating through the rows
-    wb = load_workbook(filename)
-    ws = wb.active
-    for idx, rows in enumerate(ws.iter_rows(), start=1):
-        if rows[0].value is None or rows[0].value.lower()=="variable name": continue
+    #Get the rows of the model file (parsed once and cached until the file changes) and begin iterating through them
+    for idx, rows in enumerate(model_rows(filename), start=1):
+        if not rows or rows[0] is None or rows[0].lower()=="variable name": continue
 
         #Add element location (idx) into dictionary using element name as key
-        row_location_of_element[rows[0].value] = idx
+        row_location_of_element[rows[0]] = idx
 
     return row_location_of_element
 
@@ -799,43 +1084,16 @@ def extend_model_file(filename,edge_group,output_name):
     # #Copy a version of the most recent model file to a new location so we can alter it without affecting past work
     # os.system('cp '+current_model_file+' '+extension_model_file)
 
-    #Identify index/row location where model elements are in the extension model file
-    row_location_of_element = find_element_locations(filename)
-
-    #If an extension includes a model element that is not yet in the model, 
-    # we need to know where the first empty row is to add it in without copying over other nodes
-    max_row = len(row_location_of_element)+2
+    #Load the model file once into an in-memory document, which locates the model elements
+    #(new elements are added directly after the last element, as the simulator stops reading at the first empty row)
+    document = ModelDocument.load(filename)
 
-    #Load model file 
-    wb = load_workbook(filename)
-    ws = wb.active
+    #Add the edges: new regulators are appended to the existing regulators without loss of information,
+    # and nodes not yet in the model file are added as new rows explicitely initialized at 1
+    document.apply_edge_group(edge_group)
 
-    #Iterate through the edges you want to add and begin adding unfamiliar nodes
-    for e in edge_group[1:]:
-        #If the regulator node is not already in the model file, we must add it as a new row
-        if e[0] not in row_location_of_element:
-            ws.cell(row=max_row,column=1,value=e[0])
-            ws.cell(row=max_row,column=6,value=1) # This explicitely initializes any new nodes at 1
-            row_location_of_element[e[0]] = max_row
-            max_row += 1
-        
-        #If the regulated node is not already in the model file, we must add it as a new row
-        if e[1] not in row_location_of_element:
-            ws.cell(row=max_row,column=1,value=e[1])
-            ws.cell(row=max_row,column=6,value=1) # This explicitely initializes any new nodes at 1
-            row_location_of_element[e[1]] = max_row
-            max_row += 1
-        
-        #Determine if the interaction is positive or negative, and set the column accordingly
-        col = 2 if e[2]=='+' else 3
-
-        #Seamlessly add the new regulator to the existing regulators without loss of information
-        original = ws.cell(row=row_location_of_element[e[1]],column=col).value
-        original = original + ',' if original != None else ''
-        ws.cell(row=row_location_of_element[e[1]],column=col,value=original+e[0])
-    
-    #Save and close the extended model file
-    wb.save(output_name)
+    #Save the extended model file (in the format of the output_name extension)
+    document.save(output_name)
 
 
 def extension_network_to_excel(filename, expected_end_values):
@@ -850,41 +1108,11 @@ def extension_network_to_excel(filename, expected_end_values):
         A dictionary with keys for each node in the true network file, and values for the node's end value after simulation. 
 
     """ 
-    #Initialize key variables
-    max_row = 2
-    seen_nodes = []
+    #Initialize every node at 1, set its expected value, and add the nodes which should be in the model, in a single pass
     col_initial_values = 6
     col_expected_values = 7
-
-    #Loading the network file excel and begin iterating through rows
-    wb = load_workbook(filename)
-    ws = wb.active
-    for idx, rows in enumerate(ws.iter_rows(),start=1):
-        #Grab node name
-        node = rows[0].value
-
-        #Skip if header
-        if (node.lower()=="element"): continue
-
-        #Otherwise, make sure row is parameterized correctly
-        #Add node to list of seen nodes
-        seen_nodes.append(node)
-        ws.cell(row=idx, column=col_initial_values, value=1)
-        ws.cell(row=idx, column=col_expected_values, value=expected_end_values[node])
-        
-        #Increment max_row
-        max_row = idx + 1
-
-    #Now, going back and adding/initializing nodes which should be in the model
-    for node_check in expected_end_values:
-        if node_check not in seen_nodes:
-            ws.cell(row=max_row, column=1, value=str(node_check))
-            ws.cell(row=max_row, column=col_initial_values, value=1)
-            ws.cell(row=max_row, column=col_expected_values, value=expected_end_values[node_check])
-            seen_nodes.append(node_check)
-            max_row += 1
-
-    wb.save(filename)
+    update_network_columns(filename, {col_initial_values: {node: 1 for node in expected_end_values}, \
+        col_expected_values: expected_end_values}, add_missing_nodes = True)
 
 
 def return_extension_stats(base_name, G, real_edges, fake_edges, verbose = True, save = False, filename = 'model_stats.txt'):
@@ -1031,7 +1259,7 @@ def return_extension_stats(base_name, G, real_edges, fake_edges, verbose = True,
             print(e)
 
 
-def create_extendable_models(G, output_folder, removal_probabilities, expected_end_values, model_name = 'network', positive_probability = 0.5):
+def create_extendable_models(G, output_folder, removal_probabilities, expected_end_values, model_name = 'network', positive_probability = 0.5, seed = None):
     """Function to create identical copies of the graph G, with different probabilities of missing edges. This is done in one function to \
         ensure that an edges missing in a copy of G at low probability is also missing from a copy of G at a higher probability. This allows \
         us to control for some edges being more "important" to model performance than others.  
@@ -1060,6 +1288,9 @@ def create_extendable_models(G, output_folder, removal_probabilities, expected_e
         The probability that a newly created fake edge in the network is positive.
         This parallels the notation of network creation functions.
 
+    seed : integer [default = None]
+        Seed of the random number generator, for reproducible edge removals and fake edges. By default it is seeded from system entropy.
+
 
     Returns
     -------
@@ -1068,7 +1299,7 @@ def create_extendable_models(G, output_folder, removal_probabilities, expected_e
 
     """
     #Seed the random generator 
-    random.seed()
+    rng = random.Random(seed)
 
     #Initialize key variables
     edges_in_G = list(G.edges)
@@ -1078,7 +1309,7 @@ def create_extendable_models(G, output_folder, removal_probabilities, expected_e
     #Calculate the probability that a particular edge should be removed (we only want to do this once to not iteratively subject edges to removal repeatedly)
     for edge in edges_in_G:
         #Pick a random number
-        prob = random.random()
+        prob = rng.random()
         edges_in_G_with_probabilities.append([prob, edge])
 
     #Initialize ID variables
@@ -1109,10 +1340,10 @@ def create_extendable_models(G, output_folder, removal_probabilities, expected_e
                 real_edges_to_add_back.append([extension_ID, edge_to_remove])
 
                 #Selecting a non-existent edge
-                fake_edge = random.choice(edges_not_in_G)
+                fake_edge = rng.choice(edges_not_in_G)
                 
                 #Picking a random number to assign positive/negative, similar to network creation
-                chance = random.random()
+                chance = rng.random()
                 if chance > positive_probability: regulation = '-'
                 else: regulation = '+'
 
@@ -1148,11 +1379,14 @@ def create_extendable_models(G, output_folder, removal_probabilities, expected_e
         os.makedirs(output_folder, exist_ok=True) 
         os.makedirs(output_folder + '/Missing_' + str(percent) + '_percent/', exist_ok=True)
 
-        #Creating the new model file
-        network_to_excel(G, filename = new_model_name)
+        #Creating the new model file, with every node initialized at 1 and its expected value (as extension_network_to_excel)
+        network_to_excel(G, filename = new_model_name, initial_values = {node: 1 for node in expected_end_values}, expected_values = expected_end_values)
         
         #Make sure all nodes are in the file, even if they have no connections
-        extension_network_to_excel(new_model_name, expected_end_values)
+        missing_nodes = [node for node in expected_end_values if node not in G or G.degree(node) == 0]
+        if missing_nodes:
+            update_network_columns(new_model_name, {6: {node: 1 for node in missing_nodes}, \
+                7: {node: expected_end_values[node] for node in missing_nodes}}, add_missing_nodes = True)
 
         #Creating summary file
         return_extension_stats(base, G, real_edges_to_add_back, fake_edges_to_add_back, verbose = False, save = True, filename = summary_name)
@@ -1197,7 +1431,132 @@ def score_actual_against_expected_values(expected_dict, actual_dict):
     return score
 
 
-def BFA(start_model, possible_extensions, simulation_runs, simulation_length, output_directory):
+#State of a worker process evaluating extensions: the current best model, loaded once into the simulator, \
+# the number of accepted extensions already applied to it, and the end values the extensions are scored against
+extension_worker = dict()
+
+def start_extension_worker(network, simulation_end_values):
+    """Initializes a worker process of the pool evaluating extensions in parallel (see BFA and DFA), \
+        keeping the current best model loaded for every extension the worker evaluates. 
+
+    Parameters
+    ----------
+    network : sim.Manager
+        The current best model at the start of the extension process, loaded into the simulator. 
+
+    simulation_end_values : dictionary
+        The end values against which to score the extended models. 
+
+    """
+    extension_worker['network'] = network
+    extension_worker['accepted'] = 0
+    extension_worker['simulation_end_values'] = simulation_end_values
+
+
+def score_extension(accepted_extensions, extension, simulation_runs, simulation_length, output_file = None, seed = None, tolerance = None, engine = "scalar"):
+    """Scores a model extension in a worker process (see start_extension_worker). The worker only receives the edge groups: \
+        it first brings its model up to date with the extensions accepted since its last evaluation, \
+        then applies the extension, simulates the extended model, and reverts the extension. 
+
+    Parameters
+    ----------
+    accepted_extensions : list
+        The edge groups accepted into the current best model since the start of the extension process, in order. 
+
+    extension : list
+        The edge group to score, e.g. [0, ['1','2','+'], ['2','3','-']]. 
+
+    simulation_runs, simulation_length, output_file, seed, tolerance, engine : 
+        The simulation settings, see simulate_network_end_values. 
+
+    Returns
+    -------
+    score : float
+        The score of the extended model, see score_actual_against_expected_values.
+
+    """
+    network = extension_worker['network']
+
+    #Bring the model up to date with the accepted extensions
+    for accepted_extension in accepted_extensions[extension_worker['accepted']:]:
+        network.apply_edge_group(accepted_extension)
+    extension_worker['accepted'] = len(accepted_extensions)
+
+    #Simulate the model extended with the extension, then remove the extension
+    patch = network.apply_edge_group(extension)
+    try:
+        extension_end_values = simulate_network_end_values(network, simulation_runs, simulation_length, output_file = output_file, seed = seed, tolerance = tolerance, engine = engine)
+    finally:
+        network.revert_edge_group(patch)
+
+    return score_actual_against_expected_values(extension_worker['simulation_end_values'], extension_end_values)
+
+
+def extension_seeds(seed, count):
+    """Returns the seeds of the simulations of count extensions evaluated in parallel. 
+    With common random numbers, every extension is simulated with the shared seed. Otherwise each extension gets its own seed, \
+        derived from a single draw from the random module, so that the results do not depend on the number of workers \
+        and random.seed() keeps the extension process reproducible.
+
+    """
+    if seed is not None: return [seed]*count
+    children = np.random.SeedSequence(random.getrandbits(64)).spawn(count)
+    return [int(child.generate_state(1, np.uint64)[0]) for child in children]
+
+
+def speculative_extension_scores(executor, window, extensions, accepted_extensions, seeds, simulation_runs, simulation_length, \
+                                 extension_folder = None, tolerance = None, engine = "scalar"):
+    """Scores extensions in order in worker processes (see score_extension), evaluating the next window extensions concurrently. \
+        Used by DFA, which stops at the first extension that improves the model: closing the generator cancels the evaluations \
+        not yet started, so that the workers are free for the extensions of the improved model. 
+
+    Parameters
+    ----------
+    executor : ProcessPoolExecutor
+        The pool of worker processes, initialized with start_extension_worker. 
+
+    window : integer
+        The number of extensions evaluated ahead of the extension being scored. 
+
+    extensions, seeds : lists
+        The extensions to score, in order, and the seeds of their simulations (see extension_seeds). 
+
+    accepted_extensions : list
+        The extensions accepted into the current best model, see score_extension. 
+
+    simulation_runs, simulation_length, tolerance, engine : 
+        The simulation settings, see simulate_network_end_values. 
+
+    extension_folder : string [default = None]
+        If specified, the folder in which to save the simulation trace of each extended model. 
+
+    Yields
+    -------
+    extension, score : the extensions in order, with their scores. 
+
+    """
+    candidates = iter(zip(extensions, seeds))
+    pending = deque()
+    try:
+        while True:
+            #Keep window evaluations in flight
+            for extension, seed in candidates:
+                output_file = extension_folder + "current_best_with_extension_" + str(extension[0]) + ".txt" if extension_folder is not None else None
+                pending.append((extension, executor.submit(score_extension, list(accepted_extensions), extension, simulation_runs, simulation_length, \
+                    output_file = output_file, seed = seed, tolerance = tolerance, engine = engine)))
+                if len(pending) >= window: break
+            if not pending: return
+
+            #Score the extensions in order
+            extension, future = pending.popleft()
+            yield extension, future.result()
+    finally:
+        for extension, future in pending:
+            future.cancel()
+
+
+def BFA(start_model, possible_extensions, simulation_runs, simulation_length, output_directory, save_traces = False, common_random_numbers = False, tolerance = None, \
+        engine = "scalar", workers = 1):
     """The Breadth First Addition (BFA) extension methodology takes an model with missing information, possible extensions, and a simulation scheme \
         to find the optimal combination of extensions that lowers the score. 
 
@@ -1219,6 +1578,33 @@ def BFA(start_model, possible_extensions, simulation_runs, simulation_length, ou
 
     output_directory : string 
         The name of the folder in which the extension traces will be saved.     
+
+    save_traces : Bool [default = False]
+        Whether or not to save the simulation trace of each model to the output_directory. \
+            Simulation end values are computed in memory either way.
+        True = Yes
+        False = No
+
+    common_random_numbers : Bool [default = False]
+        Whether or not to simulate the start model and every extended model with the same random seed (common random numbers). \
+            Candidates are then compared under the same simulation noise, so fewer simulation_runs are needed to rank them reliably. \
+            The seed is drawn from the random module, so random.seed() keeps the extension process reproducible.
+        True = Yes
+        False = No
+
+    tolerance : float [default = None]
+        If specified, each model is simulated adaptively, stopping once its score is known within +/- tolerance, \
+            with simulation_runs as the maximum number of runs (see simulate_network). Models with nearly deterministic \
+            end values then only need a few runs.
+
+    engine : string [default = "scalar"]
+        The simulation engine to use, see simulate_network. With "exact", scores are free of simulation noise.
+
+    workers : integer [default = 1]
+        The number of processes between which to share the evaluation of the extensions of each iteration. \
+            The processes keep the current best model loaded and only receive the extensions to evaluate. \
+            With common random numbers the scores, and so the extensions added, are the same as with a single process; \
+            otherwise each extension is simulated with its own seed drawn from the random module (see extension_seeds).
     """
     #Begin the extension process
     iteration = 0
@@ -1235,14 +1621,17 @@ def BFA(start_model, possible_extensions, simulation_runs, simulation_length, ou
     correct_end_values = get_model_expected_values(start_model)
 
     #Redefine the start model as the current best model and move it to the output directory
-    current_best_model = output_directory + "final.xlsx"
+    #(the models of the extension process keep the format of the start model, excel or native)
+    model_extension = os.path.splitext(start_model)[1]
+    current_best_model = output_directory + "final" + model_extension
     os.system("cp "+start_model+" "+current_best_model)
 
-    #Simulate the start_model in order to calculate the error between actual end values and expected end values
-    simulate_network(start_model, simulation_runs, simulation_length, output_file = extension_folder+'/start_model_trace.txt')
+    #Draw the seed shared by every simulation when using common random numbers
+    seed = random.getrandbits(64) if common_random_numbers else None
 
-    #Grab the simulation end values from the trace file
-    simulation_end_values = get_simulation_end_values(extension_folder+'/start_model_trace.txt', simulation_runs)
+    #Simulate the start_model in order to calculate the error between actual end values and expected end values
+    start_trace = extension_folder+'/start_model_trace.txt' if save_traces else None
+    simulation_end_values = simulate_network_end_values(start_model, simulation_runs, simulation_length, output_file = start_trace, seed = seed, tolerance = tolerance, engine = engine)
 
     #Calculate the difference between actual simulation and expectation 
     previous_score = float('inf') 
@@ -1269,6 +1658,17 @@ def BFA(start_model, possible_extensions, simulation_runs, simulation_length, ou
     already_added_extensions = set() # was called ignore
     diff_trend = [current_score]
 
+    #Load the current best model once, as an in-memory document (only saved to a file once an extension is chosen)
+    # and into the simulator (initial values in column 6), in which each extension is applied and then reverted in place
+    current_document = ModelDocument.load(current_best_model)
+    current_network = sim.Manager(current_best_model, 6)
+
+    #Start the persistent pool of processes evaluating the extensions, each keeping the current best model loaded,
+    # and list the extensions accepted, with which they bring their model up to date
+    executor = ProcessPoolExecutor(max_workers = workers, initializer = start_extension_worker, \
+        initargs = (current_network, simulation_end_values)) if workers > 1 else None
+    accepted_extensions = []
+
     #Iterative addition of extensions until no more extensions reduce the score, or you run out of extensions to add
     while current_score < previous_score and len(possible_extensions) > len(already_added_extensions):
         #Update previous difference such that when we no longer see immediate improvement, we stop
@@ -1280,26 +1680,33 @@ def BFA(start_model, possible_extensions, simulation_runs, simulation_length, ou
         #Initialize the dictionary to hold scores for each extension
         extension_scores_dict = dict()
 
-        #This is a Multiprocessing piece to add and check extensions efficiently -> currently working out the kinks
-        # Parallel(n_jobs=numCores,verbose=50)(delayed(eu.extend_unit_breadth_sing)\
-        # (curr_model,ext,ignore,simRun,simLen,outPath) \
-        # for ext in extensions_left)
+        #Share the extensions that have not already been added between the worker processes, which return their scores
+        if executor is not None:
+            extensions_left = list(extensions_left)
+            seeds = extension_seeds(seed, len(extensions_left))
+            futures = [executor.submit(score_extension, list(accepted_extensions), extension_being_added, simulation_runs, simulation_length, \
+                output_file = extension_folder + "current_best_with_extension_" + str(extension_being_added[0]) + ".txt" if save_traces else None, \
+                seed = extension_seed, tolerance = tolerance, engine = engine) for extension_being_added, extension_seed in zip(extensions_left, seeds)]
+
+            #Add the scores to the score dictionary in the order of the extensions, so that ties are broken as in the serial evaluation
+            for extension_being_added, future in zip(extensions_left, futures):
+                this_extension_score = future.result()
+                extension_scores_dict[extension_being_added[0]] = this_extension_score
+                print("Extension: "+str(extension_being_added)+" has a score of: "+str(this_extension_score))
+            extensions_left = []
 
         #Iterate through extensions that have not already been added
         for extension_being_added in extensions_left:
             # print("Current extension: "+str(extension_being_added))
             #Initiate the key filenames for this model+extension combination
             ext_trace = extension_folder + "current_best_with_extension_" + str(extension_being_added[0]) + ".txt"
-            ext_model = extension_folder + "current_best_with_extension_" + str(extension_being_added[0]) + ".xlsx"
 
-            #extend the current best model with the extension
-            extend_model_file(current_best_model,extension_being_added,ext_model)
+            #extend the current best model with the extension, in the simulator only
+            patch = current_network.apply_edge_group(extension_being_added)
 
-            #Simulate the new model+extension combination model
-            simulate_network(ext_model, simulation_runs, simulation_length, ext_trace)
-
-            #Get the simulation end values
-            extension_end_values = get_simulation_end_values(ext_trace, simulation_runs)
+            #Simulate the new model+extension combination model and get the simulation end values, then remove the extension
+            extension_end_values = simulate_network_end_values(current_network, simulation_runs, simulation_length, output_file = ext_trace if save_traces else None, seed = seed, tolerance = tolerance, engine = engine)
+            current_network.revert_edge_group(patch)
 
             #Compare against expected values, score the extension, and add score to the score dictionary
             this_extension_score = score_actual_against_expected_values(simulation_end_values,extension_end_values)
@@ -1317,10 +1724,17 @@ def BFA(start_model, possible_extensions, simulation_runs, simulation_length, ou
             current_score = extension_scores_dict[minimum_extension_key]
             diff_trend += [current_score]
             already_added_extensions.add(minimum_extension_key)
-            ext_model = extension_folder + "current_best_with_extension_" + str(extension_being_added[0]) + ".xlsx"
+
+            #Extend the current best model with the best extension (the one with the minimum score), and save it
+            best_extension = next(ext for ext in possible_extensions if ext[0] == minimum_extension_key)
+            current_network.apply_edge_group(best_extension)
+            current_document.apply_edge_group(best_extension)
+            accepted_extensions.append(best_extension)
+            ext_model = extension_folder + "current_best_with_extension_" + str(minimum_extension_key) + model_extension
+            current_document.save(ext_model)
 
             iteration += 1
-            save_iteration_model = output_directory + "Iteration_" + str(iteration) + ".xlsx"
+            save_iteration_model = output_directory + "Iteration_" + str(iteration) + model_extension
             os.system("cp "+ext_model+" "+current_best_model)
             os.system("cp "+ext_model+" "+save_iteration_model)
 
@@ -1339,6 +1753,9 @@ def BFA(start_model, possible_extensions, simulation_runs, simulation_length, ou
         else:
             print("Minimum was NOT less than previous score, saving best extension.")
 
+    #Stop the worker processes
+    if executor is not None: executor.shutdown()
+
     #Once the model can no longer improve, save the progression
     print("Diff Trend: ",diff_trend)
 
@@ -1354,7 +1771,8 @@ def recursive_addition_for_DFA(current_best_model, simulation_end_values, \
                             possible_extensions, already_added_extensions, \
                             simulation_runs, simulation_length, \
                             iteration, current_score, output_directory,\
-                            diff_trend, start_time):
+                            diff_trend, start_time, save_traces = False, seed = None, tolerance = None, engine = "scalar", \
+                            executor = None, workers = 1, accepted_extensions = None):
     """This recursive function continues to extend a baseline model with the first extenion to improve the model \
         until no extension improves the model. This function is exclusively used by the DFA() function. 
 
@@ -1394,6 +1812,27 @@ def recursive_addition_for_DFA(current_best_model, simulation_end_values, \
 
     start_time : datetime.datetime.now() object
         The time the extension method started. Used to record the total elapsed time.     
+
+    save_traces : Bool [default = False]
+        Whether or not to save the simulation trace of each model to the output_directory.
+
+    seed : integer [default = None]
+        Seed of the simulations of every extended model when using common random numbers, see DFA.
+
+    tolerance : float [default = None]
+        Tolerance of the adaptive simulation of every extended model, see DFA.
+
+    engine : string [default = "scalar"]
+        The simulation engine to use, see simulate_network.
+
+    executor : ProcessPoolExecutor [default = None]
+        If specified, the pool of workers processes evaluating the extensions, see DFA.
+
+    workers : integer [default = 1]
+        The number of extensions evaluated concurrently by the executor.
+
+    accepted_extensions : list [default = None]
+        The extensions accepted into the model since the start of the extension process, in order, with which the workers bring their model up to date.
     """
     #Define where key values are stored in excel
     extension_tracker = output_directory + 'ExtensionProgress.xlsx'
@@ -1405,33 +1844,53 @@ def recursive_addition_for_DFA(current_best_model, simulation_end_values, \
     #Identification of possible extensions not yet added
     extensions_left = (ext for ext in possible_extensions if ext[0] not in already_added_extensions)
 
-    #Iteratively try extensions that have not yet been tried.
-    for extension in extensions_left:
-        print("Starting extending the current best model with extension: "+str(extension[0]))
+    #The models of the extension process keep the format of the current best model, excel or native
+    model_extension = os.path.splitext(current_best_model)[1]
+
+    #Take current best model
+    current_best_model = output_directory + "final" + model_extension
 
-        #Take current best model
-        current_best_model = output_directory + "final.xlsx"
+    #Load the current best model once, as an in-memory document (only saved to a file once an extension improves it)
+    # and into the simulator (initial values in column 6), in which each extension is applied and then reverted in place
+    current_document = ModelDocument.load(current_best_model)
+    current_network = sim.Manager(current_best_model, 6)
 
-        #Initiate the key filenames for this model+extension combination
-        ext_trace = extension_folder + "current_best_with_extension_" + str(extension[0]) + ".txt"
-        ext_model = extension_folder + "current_best_with_extension_" + str(extension[0]) + ".xlsx"
+    #Score the extensions in order, one at a time in this process,
+    # or speculatively in the worker processes, evaluating the next extensions while the first ones are scored
+    def serial_scores():
+        for extension in extensions_left:
+            #Initiate the key filenames for this model+extension combination
+            ext_trace = extension_folder + "current_best_with_extension_" + str(extension[0]) + ".txt"
 
-        #extend the current best model with the extension
-        extend_model_file(current_best_model,extension,ext_model)
+            #extend the current best model with the extension, in the simulator only
+            patch = current_network.apply_edge_group(extension)
 
-        #Simulate the new model+extension combination model
-        simulate_network(ext_model, simulation_runs, simulation_length, ext_trace)
+            #Simulate the new model+extension combination model and get the simulation end values, then remove the extension
+            extension_end_values = simulate_network_end_values(current_network, simulation_runs, simulation_length, output_file = ext_trace if save_traces else None, seed = seed, tolerance = tolerance, engine = engine)
+            current_network.revert_edge_group(patch)
 
-        #Get the simulation end values
-        extension_end_values = get_simulation_end_values(ext_trace, simulation_runs)
+            #Compare against expected values and score the extension
+            yield extension, score_actual_against_expected_values(simulation_end_values,extension_end_values)
 
-        #Compare against expected values, score the extension, and add score to the score dictionary
-        new_score = score_actual_against_expected_values(simulation_end_values,extension_end_values)
+    if executor is None:
+        extension_scores = serial_scores()
+    else:
+        extensions_left = list(extensions_left)
+        extension_scores = speculative_extension_scores(executor, workers, extensions_left, accepted_extensions, extension_seeds(seed, len(extensions_left)), \
+            simulation_runs, simulation_length, extension_folder if save_traces else None, tolerance, engine)
+
+    #Iteratively try extensions that have not yet been tried.
+    for extension, new_score in extension_scores:
+        print("Starting extending the current best model with extension: "+str(extension[0]))
+        ext_model = extension_folder + "current_best_with_extension_" + str(extension[0]) + model_extension
         print("Extension: "+str(extension)+" has a score of: "+str(new_score))      
 
         #Is the score better? Make it the new best model and call recursion
         if new_score < current_score:
             print("Extension: "+str(extension)+" is an improvement.")
+
+            #This is the extension the serial walk would pick: stop evaluating the following extensions
+            extension_scores.close()
             
             #Update the current score to reflect the new best score
             current_score = new_score
@@ -1441,8 +1900,11 @@ def recursive_addition_for_DFA(current_best_model, simulation_end_values, \
             already_added_extensions.add(extension[0])
 
             #Save the improved model as the current_best_model
+            current_document.apply_edge_group(extension)
+            current_document.save(ext_model)
+            if accepted_extensions is not None: accepted_extensions.append(extension)
             iteration += 1
-            save_iteration_model = output_directory + "Iteration_" + str(iteration) + ".xlsx"
+            save_iteration_model = output_directory + "Iteration_" + str(iteration) + model_extension
             os.system("cp "+ext_model+" "+current_best_model)
             os.system("cp "+ext_model+" "+save_iteration_model)
 
@@ -1465,7 +1927,8 @@ def recursive_addition_for_DFA(current_best_model, simulation_end_values, \
                             possible_extensions, already_added_extensions, \
                             simulation_runs, simulation_length, \
                             iteration, current_score, output_directory,\
-                            diff_trend, start_time)
+                            diff_trend, start_time, save_traces, seed, tolerance, engine, \
+                            executor, workers, accepted_extensions)
 
             #End recursion once no more improvement is possible 
             print("No more extensions have been found that improve the model.")
@@ -1487,7 +1950,8 @@ def recursive_addition_for_DFA(current_best_model, simulation_end_values, \
             continue
 
 
-def DFA(start_model, possible_extensions, simulation_runs, simulation_length, output_directory):
+def DFA(start_model, possible_extensions, simulation_runs, simulation_length, output_directory, save_traces = False, common_random_numbers = False, tolerance = None, \
+        engine = "scalar", workers = 1):
     """The Depth First Addition (DFA) extension methodology takes a model with missing information, possible extensions, and a simulation scheme \
         to find the optimal combination of extensions that lowers the score. 
 
@@ -1509,6 +1973,34 @@ def DFA(start_model, possible_extensions, simulation_runs, simulation_length, ou
 
     output_directory : string 
         The name of the folder in which the extension traces will be saved.     
+
+    save_traces : Bool [default = False]
+        Whether or not to save the simulation trace of each model to the output_directory. \
+            Simulation end values are computed in memory either way.
+        True = Yes
+        False = No
+
+    common_random_numbers : Bool [default = False]
+        Whether or not to simulate the start model and every extended model with the same random seed (common random numbers). \
+            Candidates are then compared under the same simulation noise, so fewer simulation_runs are needed to rank them reliably. \
+            The seed is drawn from the random module, so random.seed() keeps the extension process reproducible.
+        True = Yes
+        False = No
+
+    tolerance : float [default = None]
+        If specified, each model is simulated adaptively, stopping once its score is known within +/- tolerance, \
+            with simulation_runs as the maximum number of runs (see simulate_network). Models with nearly deterministic \
+            end values then only need a few runs.
+
+    engine : string [default = "scalar"]
+        The simulation engine to use, see simulate_network. With "exact", scores are free of simulation noise.
+
+    workers : integer [default = 1]
+        The number of processes between which to share the evaluation of the extensions. The next workers extensions are \
+            evaluated concurrently, and the first of them (in order) that improves the model is added, as with a single process, \
+            the evaluations of the following ones being cancelled. The processes keep the current best model loaded and only receive \
+            the extensions to evaluate. With common random numbers the extensions added are the same as with a single process; \
+            otherwise each extension is simulated with its own seed drawn from the random module (see extension_seeds).
     """
     #Begin the extension process
     iteration = 0
@@ -1525,14 +2017,17 @@ def DFA(start_model, possible_extensions, simulation_runs, simulation_length, ou
     correct_end_values = get_model_expected_values(start_model)
 
     #Redefine the start model as the current best model and move it to the output directory
-    current_best_model = output_directory + "final.xlsx"
+    #(the models of the extension process keep the format of the start model, excel or native)
+    model_extension = os.path.splitext(start_model)[1]
+    current_best_model = output_directory + "final" + model_extension
     os.system("cp "+start_model+" "+current_best_model)
 
-    #Simulate the start_model in order to calculate the error between actual end values and expected end values
-    simulate_network(start_model, simulation_runs, simulation_length, output_file = extension_folder+'/start_model_trace.txt')
+    #Draw the seed shared by every simulation when using common random numbers
+    seed = random.getrandbits(64) if common_random_numbers else None
 
-    #Grab the simulation end values from the trace file
-    simulation_end_values = get_simulation_end_values(extension_folder+'/start_model_trace.txt', simulation_runs)
+    #Simulate the start_model in order to calculate the error between actual end values and expected end values
+    start_trace = extension_folder+'/start_model_trace.txt' if save_traces else None
+    simulation_end_values = simulate_network_end_values(start_model, simulation_runs, simulation_length, output_file = start_trace, seed = seed, tolerance = tolerance, engine = engine)
 
     #Calculate the difference between actual simulation and expectation 
     previous_score = float('inf') 
@@ -1561,12 +2056,22 @@ def DFA(start_model, possible_extensions, simulation_runs, simulation_length, ou
     already_added_extensions = set() # was called ignore
     diff_trend = [current_score]
 
+    #Start the persistent pool of processes evaluating the extensions, each keeping the current best model loaded
+    # (initial values in column 6), and list the extensions accepted, with which they bring their model up to date
+    executor = ProcessPoolExecutor(max_workers = workers, initializer = start_extension_worker, \
+        initargs = (sim.Manager(current_best_model, 6), simulation_end_values)) if workers > 1 else None
+    accepted_extensions = []
+
     # #Call Recursion
     recursive_addition_for_DFA(current_best_model, simulation_end_values, \
                                 possible_extensions, already_added_extensions, \
                                 simulation_runs, simulation_length, \
                                 iteration, current_score, output_directory,\
-                                diff_trend, start_time)
+                                diff_trend, start_time, save_traces, seed, tolerance, engine, \
+                                executor, workers, accepted_extensions)
+
+    #Stop the worker processes
+    if executor is not None: executor.shutdown()
 
 
 
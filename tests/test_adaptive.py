@@ -0,0 +1,49 @@
+"""Regression checks of the stopping rule of the adaptive simulations (Manager.simulate with tolerance)."""
+
+import os
+import sys
+import random
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, os.path.join(ROOT, 'dependencies'))
+
+import Simulator.simulator as sim
+
+
+def toggle_switch():
+    """Returns a two-element model where A and B inhibit each other: their end values are anti-correlated,
+    so the sum of the end values of a run hardly varies while each end value varies widely.
+    """
+    return sim.Manager.from_spec({
+        'A': (None, 'B', 3, None, 1),
+        'B': (None, 'A', 3, None, 1),
+    })
+
+
+def test_score_half_width_anti_correlated():
+    """The half-width reflects the variance of each element, which cancels in the sum of a run."""
+    stats = sim.RunningStats(2)
+    stats.add(np.array([[0, 2], [2, 0]] * 10))
+    assert stats.score_half_width(1.96) > 0.5
+
+
+def test_adaptive_not_stopped_early_when_anti_correlated():
+    """Each end value varying by about 1, a tolerance of 0.05 needs far more than min_runs runs."""
+    model = toggle_switch()
+    stats = sim.RunningStats(2)
+    random.seed(0)
+    model.simulate(2000, 100, tolerance=0.05, min_runs=10, stats=stats)
+    assert stats.variance().min() > 0.05
+    assert model.get_runs_used() > 10*10
+
+
+def test_adaptive_converged_end_values():
+    """The means of the two symmetric elements agree within the tolerance once the simulation stops."""
+    model = toggle_switch()
+    stats = sim.RunningStats(2)
+    random.seed(1)
+    model.simulate(5000, 100, tolerance=0.1, min_runs=10, stats=stats)
+    assert model.get_runs_used() < 5000
+    assert abs(stats.mean[0] - stats.mean[1]) < 2*0.1